@@ -0,0 +1,383 @@
+from __future__ import annotations
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import zlib
+
+GBSET_HEADER = b"""<?xml version="1.0" encoding="UTF-8"  ?>
+<!DOCTYPE GBSet PUBLIC "-//NCBI//NCBI GBSeq/EN" "https://www.ncbi.nlm.nih.gov/dtd/NCBI_GBSeq.dtd">
+"""
+
+GBSEQ_PAT = re.compile(rb"<GBSeq>.*?</GBSeq>", re.DOTALL)
+GBSEQ_VERSION_PAT = re.compile(
+    rb"<GBSeq_accession-version>([^<.]+)\.(\d+)</GBSeq_accession-version>"
+)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    dirname = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    return sqlite3.connect(path)
+
+
+def _chunks(xs: List[str], size: int = 500) -> Iterator[List[str]]:
+    for start in range(0, len(xs), size):
+        yield xs[start : start + size]
+
+
+def split_gbset(xml: bytes) -> List[Tuple[str, int, bytes]]:
+    """
+    Split a GenBank XML batch into (accession, version, record) tuples
+
+    Records without a versioned accession are dropped.
+    """
+    records = []
+    for m in GBSEQ_PAT.finditer(xml):
+        version = GBSEQ_VERSION_PAT.search(m.group(0))
+        if version is not None:
+            records.append(
+                (version.group(1).decode(), int(version.group(2)), m.group(0))
+            )
+    return records
+
+
+def join_gbset(records: Iterable[bytes]) -> bytes:
+    """
+    Wrap GBSeq records in a GBSet document that Entrez.read can parse
+    """
+    return GBSET_HEADER + b"<GBSet>\n" + b"\n".join(records) + b"\n</GBSet>\n"
+
+
+class GenbankCache:
+    """
+    A local store of compressed GenBank XML records keyed by accession and
+    version.
+
+    Only requests for a specific version are served from the cache, an
+    unversioned accession may have been revised since it was cached.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = _connect(path)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS genbank (
+                accession TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                xml BLOB NOT NULL,
+                PRIMARY KEY (accession, version)
+            )
+            """
+        )
+        self.db.commit()
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM genbank").fetchone()[0]
+
+    def get(self, gb_ids: List[str]) -> Tuple[List[bytes], List[str]]:
+        """
+        Look up accessions in the cache
+
+        Return the cached records and the accessions that were not found
+        """
+        found = dict()
+        versioned = [x for x in gb_ids if "." in x]
+        for chunk in _chunks(versioned, size=250):
+            keys = [tuple(x.rsplit(".", 1)) for x in chunk]
+            where = " OR ".join(["(accession = ? AND version = ?)"] * len(keys))
+            params = [v for (acc, ver) in keys for v in (acc, ver)]
+            for (acc, ver, xml) in self.db.execute(
+                f"SELECT accession, version, xml FROM genbank WHERE {where}", params
+            ):
+                found[f"{acc}.{ver}"] = xml
+        records = [zlib.decompress(found[x]) for x in gb_ids if x in found]
+        missing = [x for x in gb_ids if x not in found]
+        return (records, missing)
+
+    def put(self, xml: bytes) -> int:
+        """
+        Store every record in a GenBank XML batch, return the number stored
+        """
+        rows = [
+            (acc, version, zlib.compress(record))
+            for (acc, version, record) in split_gbset(xml)
+        ]
+        self.db.executemany("INSERT OR REPLACE INTO genbank VALUES (?, ?, ?)", rows)
+        self.db.commit()
+        return len(rows)
+
+    def batches(self, batch_size: int = 1000) -> Iterator[bytes]:
+        """
+        Yield the latest version of every cached record as GenBank XML batches
+        """
+        cursor = self.db.execute(
+            """
+            SELECT xml FROM genbank AS g
+            WHERE version = (SELECT MAX(version) FROM genbank WHERE accession = g.accession)
+            ORDER BY accession
+            """
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield join_gbset(zlib.decompress(xml) for (xml,) in rows)
+
+
+def _unversioned(accession: str) -> str:
+    return accession.split(".")[0]
+
+
+class AccessionIndex:
+    """
+    A local index of the GenBank accessions that have been loaded into each
+    database (identified by url and repository name).
+
+    Accessions are stored without their version suffix, matching the
+    `genbank_id` values in the database.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = _connect(path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS accession (
+                url TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                accession TEXT NOT NULL,
+                PRIMARY KEY (url, repo, accession)
+            );
+            CREATE TABLE IF NOT EXISTS built (
+                url TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                PRIMARY KEY (url, repo)
+            );
+            """
+        )
+        self.db.commit()
+
+    def is_built(self, url: str, repo: str) -> bool:
+        """
+        Has this index been filled from the database?
+        """
+        row = self.db.execute(
+            "SELECT 1 FROM built WHERE url = ? AND repo = ?", (url, repo)
+        ).fetchone()
+        return row is not None
+
+    def rebuild(self, url: str, repo: str, accessions: Iterable[str]) -> None:
+        """
+        Replace the index for a database with a full list of its accessions
+        """
+        self.db.execute(
+            "DELETE FROM accession WHERE url = ? AND repo = ?", (url, repo)
+        )
+        self.add(url, repo, accessions, commit=False)
+        self.db.execute("INSERT OR IGNORE INTO built VALUES (?, ?)", (url, repo))
+        self.db.commit()
+
+    def clear(self, url: str, repo: str) -> None:
+        """
+        Forget every accession in a database, the index must then be rebuilt
+        """
+        self.db.execute(
+            "DELETE FROM accession WHERE url = ? AND repo = ?", (url, repo)
+        )
+        self.db.execute("DELETE FROM built WHERE url = ? AND repo = ?", (url, repo))
+        self.db.commit()
+
+    def add(
+        self, url: str, repo: str, accessions: Iterable[str], commit: bool = True
+    ) -> None:
+        """
+        Record accessions that have been loaded into a database
+        """
+        self.db.executemany(
+            "INSERT OR IGNORE INTO accession VALUES (?, ?, ?)",
+            ((url, repo, _unversioned(acc)) for acc in accessions),
+        )
+        if commit:
+            self.db.commit()
+
+    def missing(self, url: str, repo: str, accessions: List[str]) -> List[str]:
+        """
+        Get the accessions (in input order) that are not in the index
+        """
+        present: Set[str] = set()
+        for chunk in _chunks([_unversioned(acc) for acc in accessions]):
+            marks = ",".join("?" * len(chunk))
+            present.update(
+                acc
+                for (acc,) in self.db.execute(
+                    f"SELECT accession FROM accession WHERE url = ? AND repo = ? AND accession IN ({marks})",
+                    [url, repo] + chunk,
+                )
+            )
+        return [acc for acc in accessions if _unversioned(acc) not in present]
+
+
+class UploadLedger:
+    """
+    A record of the md5 checksums of the turtle files that have been uploaded
+    to each database (identified by url and repository name).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = _connect(path)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploaded (
+                url TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                md5 TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                PRIMARY KEY (url, repo, md5)
+            )
+            """
+        )
+        self.db.commit()
+
+    def contains(self, url: str, repo: str, md5: str) -> bool:
+        """
+        Has a file with this checksum been uploaded to the database?
+        """
+        row = self.db.execute(
+            "SELECT 1 FROM uploaded WHERE url = ? AND repo = ? AND md5 = ?",
+            (url, repo, md5),
+        ).fetchone()
+        return row is not None
+
+    def add(self, url: str, repo: str, md5: str, filename: str) -> None:
+        """
+        Record a file that has been uploaded to the database
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO uploaded VALUES (?, ?, ?, ?)",
+            (url, repo, md5, filename),
+        )
+        self.db.commit()
+
+    def clear(self, url: str, repo: str) -> None:
+        """
+        Forget every upload to a database
+        """
+        self.db.execute("DELETE FROM uploaded WHERE url = ? AND repo = ?", (url, repo))
+        self.db.commit()
+
+
+class QueryCache:
+    """
+    A local store of SPARQL query results for each database (identified by url
+    and repository name).
+
+    Results are keyed by the query text and the version stamp of the database.
+    The stamp is bumped whenever octofludb changes the database, which makes
+    every earlier result stale. Results older than `ttl` seconds are dropped
+    (this also covers changes made by other clients) and the least recently
+    used results are dropped once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.db = _connect(path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS stamp (
+                url TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                stamp INTEGER NOT NULL,
+                PRIMARY KEY (url, repo)
+            );
+            CREATE TABLE IF NOT EXISTS result (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                size INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+            """
+        )
+        self.db.commit()
+
+    def stamp(self, url: str, repo: str) -> int:
+        """
+        Get the version stamp of a database
+        """
+        row = self.db.execute(
+            "SELECT stamp FROM stamp WHERE url = ? AND repo = ?", (url, repo)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def _key(self, query: str, url: str, repo: str) -> str:
+        stamp = self.stamp(url, repo)
+        text = "\n".join([url, repo, str(stamp), query])
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get(self, query: str, url: str, repo: str) -> Optional[dict]:
+        """
+        Get the cached results of a query, or None if there are none
+        """
+        key = self._key(query, url, repo)
+        now = time.time()
+        self.db.execute("DELETE FROM result WHERE created < ?", (now - self.ttl,))
+        row = self.db.execute(
+            "SELECT data FROM result WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self.db.execute("UPDATE result SET accessed = ? WHERE key = ?", (now, key))
+        self.db.commit()
+        return None if row is None else json.loads(zlib.decompress(row[0]))
+
+    def put(self, query: str, url: str, repo: str, results: dict) -> None:
+        """
+        Store the results of a query
+        """
+        data = zlib.compress(json.dumps(results).encode())
+        if self.ttl <= 0 or len(data) > self.max_bytes:
+            return None
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO result VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self._key(query, url, repo), url, repo, now, now, len(data), data),
+        )
+        total = 0
+        stale = []
+        for (key, size) in self.db.execute(
+            "SELECT key, size FROM result ORDER BY accessed DESC"
+        ):
+            total += size
+            if total > self.max_bytes:
+                stale.append((key,))
+        self.db.executemany("DELETE FROM result WHERE key = ?", stale)
+        self.db.commit()
+
+    def bump(self, url: str, repo: str) -> None:
+        """
+        Record that a database has changed, its cached results are dropped
+        """
+        self.db.execute("INSERT OR IGNORE INTO stamp VALUES (?, ?, 0)", (url, repo))
+        self.db.execute(
+            "UPDATE stamp SET stamp = stamp + 1 WHERE url = ? AND repo = ?",
+            (url, repo),
+        )
+        self.db.execute("DELETE FROM result WHERE url = ? AND repo = ?", (url, repo))
+        self.db.commit()
+
+    def clear(self, url: str, repo: str) -> None:
+        """
+        Forget every cached result from a database
+        """
+        self.bump(url, repo)
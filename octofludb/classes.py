@@ -1,18 +1,52 @@
 from __future__ import annotations
-from typing import Set, Dict, List, Optional, Any, Type, TextIO, Tuple, Union
-
-import parsec
+from typing import (
+    Set,
+    Dict,
+    List,
+    Optional,
+    Any,
+    Type,
+    TextIO,
+    Tuple,
+    Union,
+    Iterator,
+    Iterable,
+)
+
+import io
 from octofludb.classifier_flucrew import allClassifiers
-from octofludb.token import Token, Unknown, Missing
-from octofludb.util import strOrNone, log, concat, die
+from octofludb.token import Token, Unknown, Missing, test_one
+from octofludb.util import (
+    strOrNone,
+    log,
+    die,
+    chunked,
+    ordered_imap,
+    read_fasta,
+    uniq_window,
+)
 from octofludb.nomenclature import make_tag_uri, make_literal, P
-import xlrd  # type: ignore
-import pandas as pd  # type: ignore
+from octofludb.turtle import sorted_triples
 import octofludb.colors as colors
 import datetime as datetime
 from rdflib.term import Node
 from tqdm import tqdm  # type: ignore
-from collections import OrderedDict
+from collections import OrderedDict, Counter
+from itertools import chain, islice
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+# The number of distinct recent triples remembered when removing duplicates
+# from a triple stream. Duplicates further apart than this are written twice,
+# which is harmless since the database stores triples as a set.
+DEDUP_WINDOW = 100000
+
+# Phrases are sent to worker processes in shards of this size
+SHARD_SIZE = 1000
+
+# A column is given the first type that matches more than this share of its
+# values
+TYPE_THRESHOLD = 0.8
 
 
 def get_filename(fh: Union[str, TextIO]) -> Optional[str]:
@@ -123,19 +157,88 @@ def addTag(
     return (taguri, g)
 
 
+def classifyColumn(
+    data: List[Optional[str]],
+    classifiers: List[Type[Token]],
+    default_classifier: Type[Token],
+    na_str: List[str] = [],
+    threshold: float = TYPE_THRESHOLD,
+) -> Tuple[Type[Token], Dict[Optional[str], Optional[str]]]:
+    """
+    Find the first classifier whose goodness on the column is above threshold
+
+    The answer is the same as calling `goodness` on each classifier in turn,
+    but each distinct value is tested at most once per classifier, the most
+    common values are tested first, and a classifier is accepted or rejected
+    as soon as the untested values can no longer change the outcome.
+
+    Return the classifier and the `testOne` results it has computed
+    """
+    counts = Counter(data)
+    present = [
+        (x, n) for (x, n) in counts.most_common() if not (x in na_str or x is None)
+    ]
+    npresent = sum(n for (_, n) in present)
+    nmissing = len(data) - npresent
+
+    for classifier in classifiers:
+        total = classifier.goodness_total(len(data), nmissing)
+        if total <= 0:
+            continue
+        matches: Dict[Optional[str], Optional[str]] = dict()
+        good = 0
+        remaining = npresent
+        for (x, n) in present:
+            if (good + remaining) / total <= threshold:
+                break
+            matches[x] = test_one(classifier, x, na_str=na_str)
+            if classifier.is_good_match(x, matches[x]):
+                good += n
+            remaining -= n
+            if good / total > threshold:
+                return (classifier, matches)
+    return (default_classifier, dict())
+
+
+def castColumn(
+    data: List[Optional[str]],
+    classifier: Type[Token],
+    field: Optional[str] = None,
+    na_str: List[str] = [],
+    matches: Optional[Dict[Optional[str], Optional[str]]] = None,
+) -> List[Token]:
+    """
+    Make a token of the given type from every value in a column
+
+    `matches` holds `testOne` results that are already known. Tokens are not
+    changed once made, so cells with the same value share one token.
+    """
+    if matches is None:
+        matches = dict()
+    made: Dict[Optional[str], Token] = dict()
+    tokens = []
+    for x in data:
+        if x not in made:
+            if x not in matches:
+                matches[x] = test_one(classifier, x, na_str=na_str)
+            made[x] = classifier.from_match(x, matches[x], field=field, na_str=na_str)
+        tokens.append(made[x])
+    return tokens
+
+
 class HomoList(Interpreter):
     """
     Interpret a list of items assumed to be of the same type
     """
 
-    def cast(self, data: List[str]) -> List[Token]:
-        for classifier in self.classifiers:
-            if classifier.goodness(data, na_str=self.na_str) > 0.8:
-                c = classifier
-                break
-        else:
-            c = self.default_classifier
-        return [c(x, field=self.field, na_str=self.na_str) for x in data]
+    def cast(self, data: List[Optional[str]]) -> List[Token]:
+        (c, matches) = classifyColumn(
+            data, self.classifiers, self.default_classifier, na_str=self.na_str
+        )
+        self.classifier = c
+        return castColumn(
+            data, c, field=self.field, na_str=self.na_str, matches=matches
+        )
 
     def connect(self) -> Set[Tuple[Node, Node, Node]]:
 
@@ -180,29 +283,88 @@ class ParsedPhraseList(Interpreter):
     def parse(self, text):
         raise NotImplementedError
 
-    def connect(self) -> Set[Tuple[Node, Node, Node]]:
+    def phrases(self) -> Iterable[Phrase]:
+        """
+        Every phrase in the input
+        """
+        return self.data
+
+    def triples(
+        self, window: int = DEDUP_WINDOW, jobs: int = 1
+    ) -> Iterator[Tuple[Node, Node, Node]]:
+        """
+        Lazily generate the triples for every phrase
+
+        Duplicates are removed within a window of recent triples rather than
+        across the whole input, so memory does not grow with the input size.
+
+        If `jobs` is greater than 1, shards of phrases are sent to a pool of
+        worker processes. Their triples are merged in input order, so the
+        output is the same as with a single job.
+        """
         log("Making triples")
 
-        taguri, triples = addTag(tag=self.tag, filename=get_filename(self.text))
-        for (i, phrase) in enumerate(tqdm(self.data)):
-            triples.update(phrase.connect(taguri=taguri))
-        return triples
+        taguri, tag_triples = addTag(tag=self.tag, filename=get_filename(self.text))
+        yield from tag_triples
+
+        phrases = tqdm(self.phrases())
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                shards = ordered_imap(
+                    pool,
+                    partial(phraseTriples, taguri=taguri),
+                    chunked(phrases, SHARD_SIZE),
+                    window=2 * jobs,
+                )
+                yield from uniq_window(
+                    (t for shard in shards for t in shard), size=window
+                )
+        else:
+            yield from uniq_window(
+                (t for phrase in phrases for t in phrase.triples(taguri=taguri)),
+                size=window,
+            )
+
+    def connect(self) -> Set[Tuple[Node, Node, Node]]:
+        return set(self.triples())
+
+
+def phraseTriples(
+    phrases: List[Phrase], taguri: Optional[Node] = None
+) -> List[Tuple[Node, Node, Node]]:
+    """
+    The triples of a shard of phrases, in order
+    """
+    return [t for phrase in phrases for t in phrase.triples(taguri=taguri)]
 
 
 def tabularTyping(
     data: Dict[str, List[Optional[str]]],
     levels: Optional[Set[str]] = None,
     na_str: List[str] = [],
+    types: Optional[Dict[str, Type[Token]]] = None,
 ) -> List[Phrase]:
+    """
+    Infer the type of each column and make a phrase from each row
+
+    Columns that already have a type in `types` are cast to it, the types
+    inferred for the other columns are added to `types`.
+    """
     cols = []
     if not data:
         return []
     for k, v in data.items():
-        hl = HomoList(v, field=k, na_str=na_str).data
+        if types is not None and k in types:
+            cols.append(castColumn(v, types[k], field=k, na_str=na_str))
+            continue
+        homolist = HomoList(v, field=k, na_str=na_str)
+        hl = homolist.data
         if len(hl) > 0:
             log(f" - '{k}':{colors.good(hl[0].typename)}")
         else:
             log(f"{colors.bad('Warning:')} no data")
+        if types is not None:
+            types[k] = homolist.classifier
         cols.append(hl)
     phrases = [
         Phrase([col[i] for col in cols], levels=levels) for i in range(len(cols[0]))
@@ -232,14 +394,35 @@ class Table(ParsedPhraseList):
 
     The table may be a TAB-delimited file or an excel file. It is assumed to
     have a header.
+
+    If `chunk_size` is set, column types are inferred from the first
+    `chunk_size` rows of a TAB-delimited file. The remaining rows are read and
+    cast to these types `chunk_size` rows at a time as the triples are
+    generated, so the whole table is never held in memory.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, chunk_size: Optional[int] = None, **kwargs):
         self.header: List[str] = []
+        self.chunk_size = chunk_size
+        self.types: Dict[str, Type[Token]] = dict()
+        self.rest: Optional[Iterator[List[str]]] = None
         super().__init__(*args, **kwargs)
 
     def cast(self, data: Dict[str, List[Optional[str]]]) -> List[Phrase]:
-        return tabularTyping(data, levels=self.levels, na_str=self.na_str)
+        return tabularTyping(
+            data, levels=self.levels, na_str=self.na_str, types=self.types
+        )
+
+    def phrases(self) -> Iterable[Phrase]:
+        if self.rest is None or self.chunk_size is None:
+            return self.data
+        return chain(self.data, self._read_chunks(self.rest, self.chunk_size))
+
+    def _read_chunks(
+        self, rows: Iterator[List[str]], chunk_size: int
+    ) -> Iterator[Phrase]:
+        for chunk in chunked(rows, chunk_size):
+            yield from self.cast(self._columns(chunk))
 
     def parse(self, text: Union[str, TextIO]) -> Dict[str, List[Optional[str]]]:
         """
@@ -256,6 +439,9 @@ class Table(ParsedPhraseList):
         return data
 
     def _parse_excel(self, text: TextIO) -> Dict[str, List[Optional[str]]]:
+        import xlrd  # type: ignore
+        import pandas as pd  # type: ignore
+
         try:
             log(f"Reading {text.name} as excel file ...")
             d = pd.read_excel(text.name)
@@ -270,24 +456,30 @@ class Table(ParsedPhraseList):
     def _parse_table(
         self, text: Union[str, TextIO], delimiter: str = "\t"
     ) -> Dict[str, List[Optional[str]]]:
+        lines: Iterable[str]
         if isinstance(text, str):
             log("Reading raw string as tab-delimited file ...")
-            lines = [s.rstrip() for s in text.split("\n")]
+            lines = (s.rstrip() for s in text.split("\n"))
         else:
             log(f"Reading '{text.name}' as tab-delimited file ...")
-            lines = text.readlines()
+            lines = text
 
-        rows = [r.split(delimiter) for r in lines]
-        if len(rows) == 0:
+        rows = (r.split(delimiter) for r in lines)
+        header = next(rows, None)
+        if header is None:
             die("Empty input table, it should at least have a header")
-        else:
-            self.header = [c.strip() for c in rows[0]]
-            indices = range(len(self.header))
-            rows = rows[1:]
-            columns = {
-                self.header[i]: [strOrNone(r[i].strip()) for r in rows] for i in indices
-            }
-            return columns
+        self.header = [c.strip() for c in header]
+        if self.chunk_size is None:
+            return self._columns(rows)
+        self.rest = rows
+        return self._columns(islice(rows, self.chunk_size))
+
+    def _columns(self, rows: Iterable[List[str]]) -> Dict[str, List[Optional[str]]]:
+        rows = list(rows)
+        return {
+            self.header[i]: [strOrNone(r[i].strip()) for r in rows]
+            for i in range(len(self.header))
+        }
 
 
 class Ragged(ParsedPhraseList):
@@ -326,27 +518,14 @@ class Ragged(ParsedPhraseList):
         Parse a fasta file. The header is split into fields on 'sep'. The
         sequence is added as a final field.
         """
-        p_header = parsec.string(">") >> parsec.regex("[^\n\r]*") << parsec.spaces()
-        p_seq = (
-            parsec.sepBy1(
-                parsec.regex("[^>\n\r]*"), sep=parsec.regex("[\r\n\t ]+")
-            ).parsecmap(concat)
-            << parsec.spaces()
-        )
-        p_entry = p_header + p_seq
-        p_fasta = parsec.many1(p_entry)
-
         if isinstance(text, str):
             log("Reading raw string as a fasta data:")
-            fasta_str = text
+            lines: Iterable[str] = io.StringIO(text)
         else:
             log(f"Reading '{text.name}' as a fasta file:")
-            fasta_str = text.read()
-
-        entries = p_fasta.parse(fasta_str)
+            lines = text
 
-        row = [h.split(sep) + [q] for (h, q) in entries]
-        return row
+        return list(read_fasta(lines, sep=sep))
 
 
 #  class HetList(Interpreter):
@@ -375,8 +554,22 @@ class Phrase:
         Create links between a list of Tokens. For example, they may be related
         by fields in a fasta header or elements in a row in a table.
         """
+        return set(self.triples(taguri=taguri))
 
-        g = set()
+    def triples(self, taguri=None) -> Iterator[Tuple[Node, Node, Node]]:
+        """
+        Generate the links between the Tokens without duplicates, with all
+        triples that share a subject yielded together.
+
+        The triples are sorted, so their order does not depend on the hash
+        seed of the process that made them.
+        """
+
+        by_subject: Dict[Node, Dict[Tuple[Node, Node], None]] = dict()
+
+        def add(g: Iterable[Tuple[Node, Node, Node]]) -> None:
+            for (s, p, o) in g:
+                by_subject.setdefault(s, dict())[(p, o)] = None
 
         for token in self.tokens:
             if token.clean is None:
@@ -386,14 +579,16 @@ class Phrase:
             # or if the current token is one of the allowed levels
             # then find relations
             if self.levels is None or (token.group in self.levels):
-                g.update(token.relate(tokens=self.tokens, levels=self.levels))
-            g.update(token.add_triples())
+                add(token.relate(tokens=self.tokens, levels=self.levels))
+            add(token.add_triples())
             if taguri and token.group:
                 turi = token.as_uri()
                 if turi:
-                    g.add((turi, P.tag, taguri))
+                    add([(turi, P.tag, taguri)])
 
-        return g
+        yield from sorted_triples(
+            (s, p, o) for s, pos in by_subject.items() for (p, o) in pos
+        )
 
     def __str__(self):
         return str([(t.typename, t.field, t.clean) for t in self.tokens])
@@ -430,18 +430,15 @@ class SequenceToken(Token):
                 return True
         return None
 
+    # sequences must be longer than 20 characters and missing values count
+    # against the column
     @classmethod
-    def goodness(cls, items, na_str=[]):
-        column_matches = [
-            bool(cls.testOne(item=x, na_str=na_str)) and len(str(x)) > 20
-            for x in items
-            if not (x in na_str or x is None)
-        ]
-        if len(items) > 0:
-            goodness = sum(column_matches) / len(items)
-        else:
-            goodness = 0
-        return goodness
+    def is_good_match(cls, item, match):
+        return bool(match) and len(str(item)) > 20
+
+    @classmethod
+    def goodness_total(cls, nitems, nmissing):
+        return nitems
 
 
 class Dnaseq(SequenceToken):
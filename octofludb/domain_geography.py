@@ -1,4 +1,5 @@
 import re
+import functools
 from octofludb.spellcheck import make_flat_wordfinder
 
 STATE_NAME2ABBR = {
@@ -59,6 +60,7 @@ STATE_ABBR = set(STATE_NAME2ABBR.values())
 state_correction = make_flat_wordfinder(STATE_NAME2ABBR.keys())
 
 
+@functools.lru_cache(maxsize=10000)
 def state_to_code(name):
     """Get the two letter code from a state name. Return None on failure."""
     try:
@@ -387,9 +389,11 @@ COUNTRY_ABBREVIATIONS = set(COUNTRY_3LETTER_CODES.values())
 
 clean_name = re.compile("of_|the_|and_|_of|_the|_and")
 
-country_correction = make_flat_wordfinder(COUNTRY_NAMES)
+# country names of 8 or more characters are matched within two edits
+country_correction = make_flat_wordfinder(COUNTRY_NAMES, depth=2, deep_min_length=8)
 
 
+@functools.lru_cache(maxsize=10000)
 def country_to_code(name):
     """Get the ISO 3-letter codes for a country. Return None on failure."""
     try:
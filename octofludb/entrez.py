@@ -3,20 +3,64 @@ from typing import (
     List,
     Tuple,
     Generator,
+    Optional,
 )
 
-import sys
+import io
 import time
 import os
 import requests
 import datetime
+import calendar
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from Bio import Entrez  # type: ignore
 from tqdm import tqdm  # type: ignore
-from octofludb.util import log
+from octofludb.util import log, ordered_imap, backoff_delay
+from octofludb.cache import GenbankCache, AccessionIndex, join_gbset
 import octofludb.colors as colors
+import octofludb.script as script
 import pgraphdb as db
 
 Entrez.email = "tavis.anderson@usda.gov"
+Entrez.api_key = os.environ.get("NCBI_API_KEY")  # type: ignore
+# Retries are handled by fetch_gb_xml, disable Biopython's flat 15s retry loop
+Entrez.max_tries = 1
+
+
+class RateLimiter:
+    """
+    A thread-safe token bucket allowing `rate` requests per second on average
+    and bursts of up to `burst` requests.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        """
+        Block until a request may be sent
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.last) * self.rate
+            )
+            self.last = now
+            if self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.rate)
+                self.last = time.monotonic()
+                self.tokens = 1
+            self.tokens -= 1
+
+
+# NCBI allows 3 requests per second without an API key and 10 with one. All
+# E-utilities requests made from octofludb share this limiter.
+ncbi_limiter = RateLimiter(rate=10 if Entrez.api_key else 3)
 
 
 def get_all_acc_in_db(
@@ -32,16 +76,16 @@ def get_all_acc_in_db(
     return [x["acc"]["value"] for x in acc["results"]["bindings"]]
 
 
-def get_acc_by_date(
+def _esearch(
     mindate: str,
     maxdate: str,
-    ignore: List[str] = [],
-    retmax: int = 100000,
-    query: str = '"Influenza+A+Virus"[Organism]',
-) -> List[str]:
+    retmax: int,
+    query: str,
+    retstart: int = 0,
+    max_attempts: int = 3,
+) -> Optional[dict]:
     """
-    mindate: a date string of form YYYY/MM, e.g. "2020/01"
-    maxdate: a date string of form YYYY/MM, e.g. "2020/06"
+    Run one esearch query, return the "esearchresult" object or None on failure
     """
     base = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
     params = {
@@ -49,46 +93,104 @@ def get_acc_by_date(
         "term": query,
         "retmode": "json",
         "retmax": str(retmax),
+        "retstart": str(retstart),
         "datetype": "pdat",
         "mindate": mindate,
         "maxdate": maxdate,
         "idtype": "acc",
     }
+    if Entrez.api_key:
+        params["api_key"] = Entrez.api_key
 
-    req = requests.get(base, params=params)
-    try:
-        result = req.json()["esearchresult"]
+    for attempt in range(max_attempts):
+        ncbi_limiter.wait()
+        try:
+            req = requests.get(base, params=params)
+            return req.json()["esearchresult"]
+        except Exception as err:
+            error = err
+            if attempt + 1 < max_attempts:
+                time.sleep(backoff_delay(attempt))
 
-        if int(result["retmax"]) < int(result["count"]):
-            log(
-                f'{colors.bad("Warning:")} results truncated at {result["retmax"]} of {result["count"]} ids'
-            )
-    except:
-        log(f'{colors.bad("Error:")} could not find "esearchresult"')
-        log(str(req))
-        log(str(params))
+    log(f'{colors.bad("Error:")} could not find "esearchresult"')
+    log(str(error))
+    log(str(params))
+    return None
+
+
+def _date_range(mindate: str, maxdate: str) -> Tuple[datetime.date, datetime.date]:
+    """
+    Get the first and last days covered by esearch dates of the form YYYY,
+    YYYY/MM or YYYY/MM/DD
+    """
+    lower = [int(x) for x in mindate.split("/")] + [1, 1]
+    upper = [int(x) for x in maxdate.split("/")]
+    if len(upper) == 1:
+        upper.append(12)
+    if len(upper) == 2:
+        upper.append(calendar.monthrange(upper[0], upper[1])[1])
+    return (datetime.date(*lower[0:3]), datetime.date(*upper[0:3]))
+
+
+def _fmt_date(date: datetime.date) -> str:
+    return date.strftime("%Y/%m/%d")
+
+
+def get_acc_by_date(
+    mindate: str,
+    maxdate: str,
+    ignore: List[str] = [],
+    retmax: int = 100000,
+    query: str = '"Influenza+A+Virus"[Organism]',
+) -> List[str]:
+    """
+    mindate: a date string of form YYYY/MM, e.g. "2020/01"
+    maxdate: a date string of form YYYY/MM, e.g. "2020/06"
+
+    If the window holds more than `retmax` accessions, it is split in half
+    until every piece fits. A single day that is still too large is paged.
+    """
+    result = _esearch(mindate, maxdate, retmax=retmax, query=query)
+    if result is None:
         return []
 
-    # For great manner
-    time.sleep(1)
+    count = int(result["count"])
+    idlist = result["idlist"]
+    if count <= retmax:
+        return idlist
 
-    return result["idlist"]
+    (first, last) = _date_range(mindate, maxdate)
+    if first < last:
+        log(f"{count} ids from {mindate} to {maxdate} exceed {retmax}, splitting")
+        mid = first + (last - first) // 2
+        return get_acc_by_date(
+            _fmt_date(first), _fmt_date(mid), retmax=retmax, query=query
+        ) + get_acc_by_date(
+            _fmt_date(mid + datetime.timedelta(days=1)),
+            _fmt_date(last),
+            retmax=retmax,
+            query=query,
+        )
 
+    for retstart in range(retmax, count, retmax):
+        page = _esearch(mindate, maxdate, retmax=retmax, query=query, retstart=retstart)
+        if page is None:
+            log(
+                f'{colors.bad("Warning:")} results truncated at {len(idlist)} of {count} ids'
+            )
+            break
+        idlist += page["idlist"]
+    return idlist
 
-def missing_acc_by_date(
-    min_year: int = 1918,
-    max_year: int = 2099,
-    nmonths: int = 9999,
-    url: str = "http://localhost:7200",
-    repo: str = "octofludb",
-) -> Generator[Tuple[str, List[str]], None, None]:
+
+def _search_dates(min_year: int, max_year: int, nmonths: int) -> List[str]:
     """
-    Find all genbank accessions that are missing from the database. Return as a tuples of (date, [accession])
+    List the months (and, before 2000, the years) to search, newest first
     """
     now = datetime.datetime.now()
     cur_year, cur_month = now.year, now.month
 
-    old_acc = {s for s in get_all_acc_in_db(url=url, repo=repo)}
+    dates = []
 
     # step backwards in time, month-by-month to year 2000
     for year in reversed(range(2000, cur_year + 1)):
@@ -103,12 +205,8 @@ def missing_acc_by_date(
             if year == cur_year and month > cur_month:
                 # pulling future sequences is not yet supported
                 continue
-            mth_acc = get_acc_by_date(
-                mindate=f"{str(year)}/{str(month)}", maxdate=f"{str(year)}/{str(month)}"
-            )
-            new_acc = [acc for acc in mth_acc if acc not in old_acc]
+            dates.append(f"{str(year)}/{str(month)}")
             nmonths -= 1
-            yield (f"{str(year)}/{str(month)}", new_acc)
 
     # step backwards in time, year-by-year to year 1918
     for year in reversed(range(1918, 2000)):
@@ -116,28 +214,211 @@ def missing_acc_by_date(
             break
         if year > max_year:
             continue
-        year_acc = get_acc_by_date(mindate=str(year), maxdate=str(year))
-        new_acc = [acc for acc in year_acc if acc not in old_acc]
+        dates.append(str(year))
         #  nmonths -= 12
-        yield (str(year), new_acc)
 
+    return dates
 
-# code adapted from http://biopython.org/DIST/docs/tutorial/Tutorial.html#htoc122
-def get_gbs(gb_ids: List[str]) -> Generator[dict, None, None]:
-    batch_size = 1000
-    count = len(gb_ids)
-    for start in tqdm(range(0, count, batch_size)):
-        end = min(count, start + batch_size)
-        attempt = 0
-        while attempt < 10:
-            try:
-                h = Entrez.efetch(db="nucleotide", id=gb_ids[start:end], retmode="xml")
-                x = Entrez.read(h)
-                h.close()
-                yield x
+
+def missing_acc_by_date(
+    min_year: int = 1918,
+    max_year: int = 2099,
+    nmonths: int = 9999,
+    url: str = "http://localhost:7200",
+    repo: str = "octofludb",
+    index: Optional[AccessionIndex] = None,
+    workers: int = 3,
+) -> Generator[Tuple[str, List[str]], None, None]:
+    """
+    Find all genbank accessions that are missing from the database. Return as a tuples of (date, [accession])
+
+    If a local accession index is given, it is used instead of pulling every
+    accession from the database. The index is filled from the database the
+    first time it is used.
+
+    Up to `workers` dates are searched at once, results are still yielded from
+    newest to oldest.
+    """
+    if index is None:
+        old_acc = {s for s in get_all_acc_in_db(url=url, repo=repo)}
+
+        def find_new(accs: List[str]) -> List[str]:
+            return [acc for acc in accs if acc not in old_acc]
+
+    else:
+        if not index.is_built(url, repo):
+            log("Building the local accession index from the database ...")
+            index.rebuild(url, repo, get_all_acc_in_db(url=url, repo=repo))
+
+        def find_new(accs: List[str]) -> List[str]:
+            return index.missing(url, repo, accs)
+
+    def search(date: str) -> List[str]:
+        return get_acc_by_date(mindate=date, maxdate=date)
+
+    dates = _search_dates(min_year, max_year, nmonths)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for date, acc in zip(dates, ordered_imap(pool, search, dates, window=workers)):
+            yield (date, find_new(acc))
+
+
+def _retry_after(err: Exception) -> float:
+    """
+    Get the delay requested in a Retry-After header, or 0 if there is none
+    """
+    try:
+        return float(err.headers["Retry-After"])  # type: ignore
+    except Exception:
+        return 0
+
+
+def _is_permanent(err: Exception) -> bool:
+    """
+    Client errors (other than rate limiting) will not go away on retrying
+    """
+    code = getattr(err, "code", None)
+    return isinstance(code, int) and 400 <= code < 500 and code != 429
+
+
+class IncompleteGenbankXml(Exception):
+    """
+    An efetch response body that is not a complete GenBank XML document
+    """
+
+
+class RejectedGenbankFetch(Exception):
+    """
+    An efetch response that is an NCBI <ERROR> document rather than a GBSet
+    """
+
+
+def _check_gbset(xml: bytes) -> None:
+    """
+    Raise an error if an efetch response is not a whole GBSet
+
+    NCBI may answer with HTTP 200 and a truncated body or an <ERROR> document.
+    """
+    if b"<GBSet>" not in xml and b"<ERROR>" in xml:
+        raise RejectedGenbankFetch(xml.decode(errors="replace").strip())
+    if b"<GBSet>" not in xml or not xml.rstrip().endswith(b"</GBSet>"):
+        raise IncompleteGenbankXml(f"incomplete GenBank XML ({len(xml)} bytes)")
+
+
+def _is_rejected(err: Exception) -> bool:
+    """
+    Did NCBI reject the request itself (e.g., a malformed accession)?
+    """
+    return _is_permanent(err) or isinstance(err, RejectedGenbankFetch)
+
+
+def fetch_gb_xml(
+    gb_ids: List[str], max_attempts: int = 6
+) -> Tuple[List[bytes], List[str], List[str]]:
+    """
+    Fetch the raw GenBank XML for a list of accessions
+
+    Transient failures (timeouts, server errors, rate limiting, truncated
+    responses) are retried with exponential backoff. If NCBI rejects a batch,
+    it is split in half and each half is fetched separately, down to single
+    accessions, so one bad accession cannot sink a whole batch.
+
+    Returns the fetched XML documents, the accessions that NCBI rejected and
+    the accessions that could not be fetched because of transient failures.
+    """
+    for attempt in range(max_attempts):
+        try:
+            ncbi_limiter.wait()
+            h = Entrez.efetch(db="nucleotide", id=gb_ids, retmode="xml")
+            xml = h.read()
+            h.close()
+            _check_gbset(xml)
+            return ([xml], [], [])
+        except Exception as err:
+            log(
+                f"Received error from server {err} ({len(gb_ids)} ids, attempt {str(attempt + 1)} of {str(max_attempts)})"
+            )
+            if _is_rejected(err):
                 break
-            except Exception as err:
-                attempt += 1
-                print(f"Received error from server {err}", file=sys.stderr)
-                print(f"Attempt {str(attempt)} of 10 attempt", file=sys.stderr)
-                time.sleep(15)
+            if attempt + 1 < max_attempts:
+                time.sleep(max(backoff_delay(attempt), _retry_after(err)))
+    else:
+        # the batch may be fine, the server or the network was not
+        return ([], [], gb_ids)
+
+    if len(gb_ids) == 1:
+        return ([], gb_ids, [])
+
+    half = len(gb_ids) // 2
+    log(f"Splitting rejected batch of {len(gb_ids)} ids")
+    (left, left_rejected, left_unfetched) = fetch_gb_xml(gb_ids[:half], max_attempts=2)
+    (right, right_rejected, right_unfetched) = fetch_gb_xml(
+        gb_ids[half:], max_attempts=2
+    )
+    return (
+        left + right,
+        left_rejected + right_rejected,
+        left_unfetched + right_unfetched,
+    )
+
+
+def get_gb_xml(
+    gb_ids: List[str],
+    batch_size: int = 1000,
+    workers: int = 3,
+    cache: Optional[GenbankCache] = None,
+) -> Generator[bytes, None, None]:
+    """
+    Fetch GenBank XML in batches of accessions
+
+    If a cache is given, cached records are yielded first and only the missing
+    accessions are downloaded, after which they are added to the cache.
+
+    Up to `workers` batches are downloaded concurrently (within the NCBI rate
+    limit). Downloaded batches are yielded in the order of the input
+    accessions.
+
+    Accessions rejected by NCBI are logged to failed_genbank_fetches.txt.
+    Batches that failed for transient reasons are logged separately to
+    unfetched_genbank_accessions.txt, since they may be fetched on a rerun.
+    """
+    if cache is not None:
+        (records, gb_ids) = cache.get(gb_ids)
+        if records:
+            log(f"Found {len(records)} GenBank records in the local cache")
+        for start in range(0, len(records), batch_size):
+            yield join_gbset(records[start : start + batch_size])
+
+    rejected: List[str] = []
+    unfetched: List[str] = []
+    count = len(gb_ids)
+    batches = (gb_ids[start : start + batch_size] for start in range(0, count, batch_size))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (xmls, batch_rejected, batch_unfetched) in tqdm(
+            ordered_imap(pool, fetch_gb_xml, batches, window=workers),
+            total=(count + batch_size - 1) // batch_size,
+        ):
+            rejected += batch_rejected
+            unfetched += batch_unfetched
+            for xml in xmls:
+                if cache is not None:
+                    cache.put(xml)
+                yield xml
+
+    if rejected:
+        logpath = script.error_log_entry(rejected, "failed_genbank_fetches.txt")
+        log(
+            f'{colors.bad("Warning:")} {len(rejected)} genbank entries were rejected by NCBI, see {logpath}'
+        )
+    if unfetched:
+        logpath = script.error_log_entry(unfetched, "unfetched_genbank_accessions.txt")
+        log(
+            f'{colors.bad("Warning:")} {len(unfetched)} genbank entries could not be downloaded (server or network errors), rerun to retry them, see {logpath}'
+        )
+
+
+# code adapted from http://biopython.org/DIST/docs/tutorial/Tutorial.html#htoc122
+def get_gbs(
+    gb_ids: List[str], workers: int = 3, cache: Optional[GenbankCache] = None
+) -> Generator[dict, None, None]:
+    for xml in get_gb_xml(gb_ids, workers=workers, cache=cache):
+        yield Entrez.read(io.BytesIO(xml))
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import List, Tuple, TextIO, Dict
+from typing import List, Tuple, TextIO, Dict, Iterable, Iterator
 
 from octofludb.util import log
 from octofludb.colors import bad
@@ -7,23 +7,32 @@ from octofludb.colors import bad
 import sys
 
 
+def binding_rows(results: dict) -> Iterator[List[str]]:
+    """
+    The rows of a SPARQL JSON query result, unbound values are empty strings
+    """
+    fields = results["head"]["vars"]
+    for row in results["results"]["bindings"]:
+        yield [row[f]["value"] if f in row else "" for f in fields]
+
+
 def write_as_fasta(results: dict, outfile: TextIO = sys.stdout) -> None:
     """
     Write a SPARQL query result as a FASTA file
     """
-    header_fields = results["head"]["vars"][:-1]
-    seq_field = results["head"]["vars"][-1]
-    for row in results["results"]["bindings"]:
-        fields = []
-        for f in header_fields:
-            if f in row:
-                fields.append(row[f]["value"])
-            else:
-                fields.append("")
-        header = "|".join(fields)
-        sequence = row[seq_field]["value"]
-        print(">" + header, file=outfile)
-        print(sequence, file=outfile)
+    write_rows_as_fasta(results["head"]["vars"], binding_rows(results), outfile)
+
+
+def write_rows_as_fasta(
+    fields: List[str], rows: Iterable[List[str]], outfile: TextIO = sys.stdout
+) -> None:
+    """
+    Write rows as FASTA entries, the last field is the sequence and the others
+    make up the header
+    """
+    for row in rows:
+        print(">" + "|".join(row[:-1]), file=outfile)
+        print(row[-1], file=outfile)
 
 
 def write_as_table(
@@ -32,18 +41,24 @@ def write_as_table(
     """
     Write a SPARQL query result as a TAB-delimited table with an optional header
     """
+    write_rows_as_table(
+        results["head"]["vars"], binding_rows(results), header=header, outfile=outfile
+    )
 
-    def val(xs, field):
-        if field in xs:
-            return xs[field]["value"]
-        else:
-            return ""
 
+def write_rows_as_table(
+    fields: List[str],
+    rows: Iterable[List[str]],
+    header: bool = True,
+    outfile: TextIO = sys.stdout,
+) -> None:
+    """
+    Write rows as a TAB-delimited table with an optional header
+    """
     if header:
-        print("\t".join(results["head"]["vars"]), file=outfile)
-    for row in results["results"]["bindings"]:
-        fields = (val(row, field) for field in results["head"]["vars"])
         print("\t".join(fields), file=outfile)
+    for row in rows:
+        print("\t".join(row), file=outfile)
 
 
 def write_constellations(results: dict, outfile: TextIO = sys.stdout) -> None:
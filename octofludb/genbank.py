@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Set, Tuple, Dict, Optional
+from typing import Set, Tuple, Dict, Optional, List
 
 from octofludb.nomenclature import (
     uidgen,
@@ -15,6 +15,7 @@ from octofludb.nomenclature import (
 from octofludb.util import safeAdd
 from octofludb.hash import chksum
 from rdflib.term import Node
+import io
 import re
 import octofludb.domain_identifier as identifier
 import octofludb.domain_flu as flu
@@ -185,3 +186,42 @@ def make_gb_meta_triples(
         error_entry = f"{locus}\tNo strain name"
 
     return (g, error_entry)
+
+
+ACCESSION_PAT = re.compile(
+    rb"<GBSeq_primary-accession>([^<]+)</GBSeq_primary-accession>"
+)
+
+
+def parse_gb_xml(
+    xml: bytes, only_influenza_a: bool = True
+) -> Tuple[Set[Tuple[Node, Node, Node]], List[str]]:
+    """
+    Make triples from a raw GenBank XML batch as returned by Entrez efetch
+
+    This takes and returns only picklable data, so batches may be parsed in
+    worker processes.
+
+    Returns
+    -------
+    The triples for all entries and the error messages for failed entries
+    """
+    from Bio import Entrez  # type: ignore
+
+    g: Set[Tuple[Node, Node, Node]] = set()
+    error_msgs = []
+    try:
+        records = Entrez.read(io.BytesIO(xml))
+    except Exception as err:
+        # one unreadable batch should not stop a long GenBank update
+        log(bad("Unreadable GenBank batch: ") + str(err))
+        accessions = [m.decode() for m in ACCESSION_PAT.findall(xml)]
+        return (g, [f"{acc}\tUnreadable GenBank batch" for acc in accessions])
+    for gb_meta in records:
+        (triples, error_msg) = make_gb_meta_triples(
+            gb_meta, only_influenza_a=only_influenza_a
+        )
+        if error_msg:
+            error_msgs.append(error_msg)
+        g.update(triples)
+    return (g, error_msgs)
@@ -6,6 +6,7 @@ import rdflib
 import urllib.parse as url
 import sys
 import re
+from functools import lru_cache
 import octofludb.domain_geography as geo
 import octofludb.domain_date as date
 from rdflib.namespace import RDFS, OWL, XSD
@@ -26,7 +27,30 @@ manager.bind("usa", nusa)
 manager.bind("world", ncountry)
 manager.bind("query", nquery)
 
+# The number of recent arguments remembered by each URI constructor. The same
+# strain names, accessions and properties recur across the tokens of a row
+# and across rows, so repeated calls return the same URIRef object.
+URI_CACHE_SIZE = 100000
 
+URI_SEP = re.compile("[ -]+")
+
+# The number of recent strings remembered by the date parsers
+DATE_CACHE_SIZE = 100000
+
+# Every string `date.p_date` accepts starts with a digit or a month name, is at
+# least 6 characters long and contains a digit
+MAYBE_DATE = re.compile(
+    r"(?=.{6})(?=.*\d)(?:\d|(?i:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec))",
+    re.DOTALL,
+)
+
+# Common ISO forms, these are read the same way by the date grammar
+ISO_DATE = re.compile(r"(20\d\d|1[89]\d\d)-(1[0-2]|0[1-9])-(3[01]|[012]\d)")
+ISO_YEAR_MONTH = re.compile(r"(20\d\d|1[89]\d\d)-(1[0-2]|0[1-9])")
+ISO_YEAR = re.compile(r"20\d\d|1\d\d\d")
+
+
+@lru_cache(maxsize=URI_CACHE_SIZE)
 def make_tag_uri(x: str) -> Node:
     tag = x.strip().replace(" ", "_").lower()
     tag = url.quote_plus(tag)
@@ -56,13 +80,15 @@ def uidgen(base="_", pad=3, start=0):
         yield ni.term(padDigit(base + str(i), pad))
 
 
+# typed, so that a URIRef is not served the URI made from an equal string
+@lru_cache(maxsize=URI_CACHE_SIZE, typed=True)
 def make_uri(x, namespace=ni) -> Optional[Node]:
     if not x:
         return None
     if isinstance(x, rdflib.term.URIRef):
         return x
     else:
-        x = re.sub("[ -]+", "_", x.strip()).lower()
+        x = URI_SEP.sub("_", x.strip()).lower()
         return namespace.term(url.quote_plus(x))
 
 
@@ -77,6 +103,7 @@ def make_usa_state_uri(code):
     return nusa.term(abbr)
 
 
+@lru_cache(maxsize=URI_CACHE_SIZE)
 def make_country_uri(countryStr):
     code = geo.country_to_code(countryStr)
     if code:
@@ -97,6 +124,23 @@ def make_date(dateStr) -> Optional[Node]:
         dateStr = str(dateStr.date())
     except AttributeError:
         pass
+    if isinstance(dateStr, str):
+        return _parse_any_date(dateStr)
+    try:
+        uri = date.p_any_date.parse_strict(dateStr).as_uri()
+    except:
+        uri = None
+    return uri
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_any_date(dateStr: str) -> Optional[Node]:
+    if ISO_DATE.fullmatch(dateStr):
+        return rdflib.Literal(dateStr, datatype=XSD.date)
+    if ISO_YEAR_MONTH.fullmatch(dateStr):
+        return rdflib.Literal(dateStr, datatype=XSD.gYearMonth)
+    if ISO_YEAR.fullmatch(dateStr):
+        return rdflib.Literal(dateStr, datatype=XSD.gYear)
     try:
         uri = date.p_any_date.parse_strict(dateStr).as_uri()
     except:
@@ -104,13 +148,22 @@ def make_date(dateStr) -> Optional[Node]:
     return uri
 
 
+@lru_cache(maxsize=URI_CACHE_SIZE)
 def make_property(x: str) -> Node:
     return nt.term(x.lower().replace(" ", "_"))
 
 
 def make_literal(x, infer=True) -> Node:
-    if not infer:
+    if not infer or not isinstance(x, str) or not MAYBE_DATE.match(x):
         return rdflib.Literal(x)
+    return _infer_literal(x)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _infer_literal(x: str) -> Node:
+    m = ISO_DATE.match(x)
+    if m:
+        return rdflib.Literal(m.group(0), datatype=XSD.date)
     try:
         # Can x be a date?
         return rdflib.Literal(str(date.p_date.parse(x)), datatype=XSD.date)
@@ -1,9 +1,18 @@
 from __future__ import annotations
-from typing import Optional, List, Set, Tuple, TextIO, Dict
+from typing import (
+    Optional,
+    List,
+    Set,
+    Tuple,
+    TextIO,
+    Dict,
+    Iterable,
+    Union,
+)
 
 import sys
+from functools import lru_cache
 from rdflib.term import Node
-import pandas as pd  # type: ignore
 import octofludb.classes as classes
 import octofludb.classifier_flucrew as flu
 import octofludb.token as tok
@@ -15,7 +24,6 @@ import re
 import math
 from tqdm import tqdm  # type: ignore
 import datetime as datetime
-from SPARQLWrapper import SPARQLWrapper  # type:ignore
 
 
 def mk_blast(
@@ -153,6 +161,8 @@ def mk_ird(filehandle: TextIO) -> Set[Tuple[Node, Node, Node]]:
 
 def mk_gis(filename: str) -> Set[Tuple[Node, Node, Node]]:
 
+    import pandas as pd  # type: ignore
+
     g = set()  # initialize triple set
 
     fh = pd.read_excel(filename, sheet_name=0, keep_default_na=False)
@@ -336,7 +346,7 @@ def _get_subtype(
 
 
 def mk_subtypes(
-    results: SPARQLWrapper,
+    results: dict,
 ) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
     entries: dict = dict()
 
@@ -424,87 +434,158 @@ MASTERLIST_HEADER: List[str] = [
 ]
 
 
-def mk_masterlist(results: dict) -> None:
-    entries: dict = dict()
+# The masterlist columns filled from each masterlist.rq variable, whatever the
+# segment (see `masterlist_plan`)
+MASTERLIST_PLAN: List[Tuple[str, str]] = [
+    ("Date", "earliest_date"),
+    ("State", "states"),
+    ("Strain", "strains"),
+    ("Subtype", "subtypes"),
+    ("Constellation", "consts"),
+    ("Motif", "h3_motifs"),
+    ("Sa_Motif", "sa_motifs"),
+    ("Sb_Motif", "sb_motifs"),
+    ("Ca1_Motif", "ca1_motifs"),
+    ("Ca2_Motif", "ca2_motifs"),
+    ("Cb_Motif", "cb_motifs"),
+]
 
-    for row in results["results"]["bindings"]:
+# columns that only use the first (in sorted order) of the "+" separated values
+# in each row
+MASTERLIST_FIRST_ONLY: Set[str] = {"Date", "Subtype"} | {
+    field for field in MASTERLIST_HEADER if field.endswith("_Genbank")
+}
+
+
+@lru_cache(maxsize=None)
+def masterlist_plan(
+    segment: str, segment_subtypes: str
+) -> Tuple[Tuple[str, str], ...]:
+    """
+    Get the (column, variable) pairs that fill the masterlist from a
+    masterlist.rq row with the given segment and segment subtypes
+    """
+    segment = segment.split("+")[0]
+    segment_subtype = min(segment_subtypes.split("+"))
+    if segment == "HA":
+        plan = [
+            ("H_Genbank", "genbank_id"),
+            ("US_Clade", "us_clades"),
+            ("GL_Clade", "gl_clades"),
+        ]
+    elif segment == "NA":
+        plan = [("N_Genbank", "genbank_id")]
+    else:
+        plan = [(segment + "_Genbank", "genbank_id"), (segment, "us_clades")]
+    if segment_subtype in ("H1", "H3", "N1", "N2"):
+        plan.append((segment_subtype, "us_clades"))
+    columns = set(MASTERLIST_HEADER)
+    return tuple(MASTERLIST_PLAN + [step for step in plan if step[0] in columns])
+
+
+def masterlist_entries(
+    bindings: Iterable[dict],
+) -> Dict[str, Dict[str, Union[str, Dict[str, None]]]]:
+    """
+    Collect the raw values of each masterlist column for each barcode in one
+    pass over the masterlist.rq rows
+
+    Values are kept unsplit, as a string until a column has a second distinct
+    value and then in a set (a dict with None values).
+    """
+    entries: Dict[str, Dict[str, Union[str, Dict[str, None]]]] = dict()
+    for row in bindings:
         barcode = row["barcode"]["value"]
-        if barcode in entries:
-            entry = entries[barcode]
+        entry = entries.get(barcode)
+        if entry is None:
+            entry = entries[barcode] = dict()
+        segment_subtypes = row.get("segment_subtypes")
+        plan = masterlist_plan(
+            row["segment"]["value"],
+            "" if segment_subtypes is None else segment_subtypes["value"],
+        )
+        for (field, variable) in plan:
+            cell = row.get(variable)
+            if cell is not None:
+                raw = cell["value"]
+                values = entry.get(field)
+                if values is None:
+                    entry[field] = raw
+                elif isinstance(values, dict):
+                    values[raw] = None
+                elif values != raw:
+                    entry[field] = {values: None, raw: None}
+    return entries
+
+
+def masterlist_row(
+    barcode: str, entry: Dict[str, Union[str, Dict[str, None]]]
+) -> List[str]:
+    """
+    Build a masterlist row from the raw values collected for a barcode
+
+    The values of each cell are sorted, so the row does not depend on the
+    order of the query results.
+    """
+    row = []
+    for field in MASTERLIST_HEADER:
+        if field == "Barcode":
+            raws: Union[str, Iterable[str]] = barcode
+        elif field == "Collection_Q":
+            dates = entry.get("Date", ())
+            date_raws: Iterable[str] = [dates] if isinstance(dates, str) else dates
+            raws = [quarter_from_date(min(raw.split("+"))) for raw in date_raws]
         else:
-            entry = dict()
-            # initialize fields
-            for field in MASTERLIST_HEADER:
-                entry[field] = []
-
-        segment = row["segment"]["value"]
-
-        genbank_id = default_access(row, "genbank_id")[0]
-        segment = default_access(row, "segment")[0]
-        subtype = default_access(row, "subtypes")[0]
-        # Use the earliest date since occasionally people resequence a sample
-        # and incorrectly set the sequence date to the collection date (among
-        # other issues)
-        date = default_access(row, "earliest_date")[0]
-        states = default_access(row, "states")
-        strains = default_access(row, "strains")
-        us_clades = default_access(row, "us_clades")
-        gl_clades = default_access(row, "gl_clades")
-        consts = default_access(row, "consts")
-        h3_motifs = default_access(row, "h3_motifs")
-        sa_motifs = default_access(row, "sa_motifs")
-        sb_motifs = default_access(row, "sb_motifs")
-        ca1_motifs = default_access(row, "ca1_motifs")
-        ca2_motifs = default_access(row, "ca2_motifs")
-        cb_motifs = default_access(row, "cb_motifs")
-
-        append_add(entry, "Date", [date])
-        append_add(entry, "Collection_Q", [quarter_from_date(date)])
-        append_add(entry, "State", states)
-
-        if segment == "HA":
-            append_add(entry, "H_Genbank", [genbank_id])
-            append_add(entry, "US_Clade", us_clades)
-            append_add(entry, "GL_Clade", gl_clades)
-        elif segment == "NA":
-            append_add(entry, "N_Genbank", [genbank_id])
-            append_add(entry, segment, us_clades)
+            raws = entry.get(field, "")
+        if isinstance(raws, str):
+            if "+" not in raws:
+                row.append(raws)
+                continue
+            raws = [raws]
+        if field in MASTERLIST_FIRST_ONLY:
+            values = {min(raw.split("+")) for raw in raws}
         else:
-            append_add(entry, segment + "_Genbank", [genbank_id])
-            append_add(entry, segment, us_clades)
+            values = {v for raw in raws for v in raw.split("+")}
+        row.append(",".join(sorted(f for f in values if f)))
+    return row
 
-        maybe_segment_subtype = default_access(row, "segment_subtypes")
-        if maybe_segment_subtype:
-            segment_subtype = maybe_segment_subtype[0]
 
-            if segment_subtype == "H1":
-                append_add(entry, "H1", us_clades)
-            elif segment_subtype == "H3":
-                append_add(entry, "H3", us_clades)
+def mk_masterlist(bindings: Iterable[dict], outfile: TextIO = sys.stdout) -> None:
+    """
+    Write the masterlist from the result bindings of masterlist.rq
+
+    The bindings may be a lazy stream of rows, only the collected column
+    values of each barcode are held in memory. Barcodes are written in sorted
+    order.
+    """
+    print("\t".join(MASTERLIST_HEADER), file=outfile)
 
-            if segment_subtype == "N1":
-                append_add(entry, "N1", us_clades)
-            elif segment_subtype == "N2":
-                append_add(entry, "N2", us_clades)
+    entries = masterlist_entries(bindings)
+    for barcode in sorted(entries):
+        print("\t".join(masterlist_row(barcode, entries[barcode])), file=outfile)
 
-        append_add(entry, "Strain", strains)
-        append_add(entry, "Subtype", [subtype])
-        append_add(entry, "Constellation", consts)
-        append_add(entry, "Motif", h3_motifs)
-        append_add(entry, "Sa_Motif", sa_motifs)
-        append_add(entry, "Sb_Motif", sb_motifs)
-        append_add(entry, "Ca1_Motif", ca1_motifs)
-        append_add(entry, "Ca2_Motif", ca2_motifs)
-        append_add(entry, "Cb_Motif", cb_motifs)
 
-        entries[barcode] = entry
+def mk_masterlist_pivot(
+    bindings: Iterable[dict], outfile: TextIO = sys.stdout
+) -> None:
+    """
+    Write the masterlist from the result bindings of masterlist-pivot.rq,
+    which has one row per barcode with the tab separated raw values of each
+    column
 
-    print("\t".join(MASTERLIST_HEADER))
+    Barcodes are written in sorted order, so the output is the same as from
+    mk_masterlist.
+    """
+    print("\t".join(MASTERLIST_HEADER), file=outfile)
 
-    for barcode, entry in entries.items():
-        entry["Barcode"] = [barcode]
-        row = [",".join([f for f in entry[field] if f]) for field in MASTERLIST_HEADER]
-        print("\t".join(row))
+    for row in sorted(bindings, key=lambda row: row["barcode"]["value"]):
+        entry: Dict[str, Union[str, Dict[str, None]]] = {
+            field: dict.fromkeys(row[field]["value"].split("\t"))
+            for field in MASTERLIST_HEADER
+            if field in row
+        }
+        barcode = row["barcode"]["value"]
+        print("\t".join(masterlist_row(barcode, entry)), file=outfile)
 
 
 class IrregularStrain(flu.StrainToken):
@@ -531,18 +612,16 @@ class IrregularFasta(classes.Ragged):
             phrases[i].tokens.append(strain_ids[i])
         return phrases
 
-    def connect(self):
+    def triples(self, *args, **kwargs):
 
-        g = set()
+        unpublished = make_tag_uri("unpublished")
 
         for phrase in self.data:
             for token in phrase.tokens:
                 if token.group == "sequence":
-                    g.add((token.as_uri(), P.tag, make_tag_uri("unpublished")))
-
-        g.update(super().connect())
+                    yield (token.as_uri(), P.tag, unpublished)
 
-        return g
+        yield from super().triples(*args, **kwargs)
 
 
 class IrregularSegment(flu.SegmentToken):
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Optional, List, Iterable, TypeVar
+from typing import Optional, List, Iterable, Tuple, TypeVar
 
 import hashlib
 import subprocess
@@ -100,6 +100,26 @@ def get_octoflu_reference(config: dict) -> Optional[str]:
     return reference
 
 
+def genbank_cache_path(config: dict) -> Optional[str]:
+    """
+    Get the path to the local GenBank record cache, or None if caching is off
+    """
+    backup_dir = config.get("genbank_backup")
+    if not backup_dir:
+        return None
+    return os.path.join(os.path.expanduser(backup_dir), "genbank.sqlite")
+
+
+def query_cache_limits(config: dict) -> Tuple[float, int]:
+    """
+    Get the lifetime (in seconds) and the maximum total size (in bytes) of
+    cached query results
+    """
+    hours = config.get("query_cache_hours", 12) or 0
+    megabytes = config.get("query_cache_mb", 500) or 0
+    return (float(hours) * 3600, int(megabytes * 1024 * 1024))
+
+
 def tag_files(config: dict, tag: str) -> List[str]:
     try:
         data_home = expandpath(config["datadir"])[0]
@@ -149,9 +169,12 @@ def load_config_file() -> dict:
     return config
 
 
-def file_md5sum(path: str) -> str:
+def file_md5sum(path: str, chunk_size: int = 1024 * 1024) -> str:
+    md5 = hashlib.md5()
     with open(path, "rb") as f:
-        return hashlib.md5(f.read()).hexdigest()
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
 
 
 def evenly_divide(total: int, preferred_size: int) -> List[int]:
@@ -0,0 +1,199 @@
+from __future__ import annotations
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, cast
+
+import csv
+import io
+import itertools
+import re
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from octofludb.util import log, die, ordered_imap, backoff_delay
+
+# a comment starts at a '#' at the start of a line or after whitespace (so the
+# '#' in an IRI such as <http://example.org/x#y> is not mistaken for one)
+COMMENT = re.compile(r"(^|\s)#[^\n]*")
+SELECT_HEAD = re.compile(
+    r"\bSELECT\s+(?:(?:DISTINCT|REDUCED)\s+)?(.*?)(?:\bFROM\b|\bWHERE\b|\{)",
+    re.IGNORECASE | re.DOTALL,
+)
+HEAD_TOKEN = re.compile(r"\(|\)|\bAS\s+[?$](\w+)|[?$](\w+)", re.IGNORECASE)
+
+
+def select_rows(
+    query: str, url: str, repo: str, session: Optional[requests.Session] = None
+) -> Tuple[List[str], Iterator[List[str]]]:
+    """
+    Run a SELECT query and stream its results
+
+    Results are requested in the SPARQL CSV format and parsed as they arrive,
+    so memory does not grow with the number of rows. Return the variable names
+    and a lazy iterator over the rows, unbound values are empty strings.
+    """
+    from pgraphdb import handle_response
+
+    start = time.monotonic()
+    response = (session or requests).post(
+        f"{url}/repositories/{repo}",
+        data={"query": query},
+        headers={"Accept": "text/csv"},
+        stream=True,
+    )
+    handle_response(response, writeResult=False)
+    response.raw.decode_content = True
+    body = cast(BinaryIO, response.raw)
+    reader = csv.reader(io.TextIOWrapper(body, encoding="utf-8", newline=""))
+    fields = next(reader, [])
+    return (fields, _timed_rows(reader, response, start))
+
+
+def _timed_rows(
+    reader: Iterator[List[str]], response: requests.Response, start: float
+) -> Iterator[List[str]]:
+    nrows = 0
+    try:
+        for row in reader:
+            if nrows == 0:
+                log(f"first row after {time.monotonic() - start:.2f}s")
+            nrows += 1
+            yield row
+    finally:
+        response.close()
+    log(f"{nrows} rows in {time.monotonic() - start:.2f}s")
+
+
+def rows_as_bindings(fields: List[str], rows: Iterable[List[str]]) -> Iterator[dict]:
+    """
+    Lazily convert CSV result rows to SPARQL JSON style bindings
+
+    The CSV format does not distinguish unbound values from empty strings,
+    both are left out of the bindings.
+    """
+    for row in rows:
+        yield {
+            field: {"type": "literal", "value": value}
+            for (field, value) in zip(fields, row)
+            if value
+        }
+
+
+def projected_vars(query: str) -> List[str]:
+    """
+    Get the names of the variables a SELECT query projects, in order
+
+    Return an empty list for `SELECT *`.
+    """
+    head = SELECT_HEAD.search(COMMENT.sub(r"\1", query))
+    if head is None:
+        die("Expected a SELECT query")
+    names = []
+    depth = 0
+    for m in HEAD_TOKEN.finditer(head.group(1)):
+        if m.group(0) == "(":
+            depth += 1
+        elif m.group(0) == ")":
+            depth -= 1
+        elif m.group(1) and depth == 1:
+            names.append(m.group(1))
+        elif m.group(2) and depth == 0:
+            names.append(m.group(2))
+    return names
+
+
+def page_query(query: str, page_size: int, page: int) -> str:
+    """
+    Rewrite a SELECT query to fetch one page of its results
+
+    Pages need a stable order, so the results are ordered by every projected
+    variable, after the keys of any ORDER BY clause the query already has.
+    """
+    solution_modifiers = COMMENT.sub(r"\1", query.rsplit("}", 1)[-1])
+    if re.search(r"\b(LIMIT|OFFSET)\b", solution_modifiers, re.IGNORECASE):
+        die("Cannot page a query that already has a LIMIT or OFFSET")
+    names = projected_vars(query)
+    if not names:
+        die("Cannot page a SELECT * query, list the selected variables instead")
+    tie_breakers = " ".join("?" + name for name in names)
+    paged = query.rstrip()
+    if re.search(r"\bORDER\s+BY\b", solution_modifiers, re.IGNORECASE):
+        # ORDER BY is the last clause, so the keys can be extended on a new line
+        # (in case the query ends with a comment)
+        paged += "\n  " + tie_breakers
+    else:
+        paged += "\nORDER BY " + tie_breakers
+    return paged + f"\nLIMIT {page_size} OFFSET {page * page_size}\n"
+
+
+def _fetch_page(
+    query: str, url: str, repo: str, max_attempts: int = 3
+) -> Tuple[List[str], List[List[str]]]:
+    """
+    Run a SELECT query and return its variable names and rows
+
+    Failed requests are retried, the last error is raised.
+    """
+    for attempt in range(max_attempts):
+        try:
+            response = requests.post(
+                f"{url}/repositories/{repo}",
+                data={"query": query},
+                headers={"Accept": "text/csv"},
+            )
+            response.raise_for_status()
+            break
+        except requests.RequestException as err:
+            status = getattr(err.response, "status_code", None)
+            # a malformed query will not improve on a second try
+            if attempt + 1 == max_attempts or (
+                status is not None and 400 <= status < 500 and status != 429
+            ):
+                raise
+            time.sleep(backoff_delay(attempt))
+    text = io.StringIO(response.content.decode("utf-8"), newline="")
+    rows = list(csv.reader(text))
+    return (rows[0] if rows else [], rows[1:])
+
+
+def select_pages(
+    query: str,
+    url: str,
+    repo: str,
+    page_size: int,
+    workers: int = 4,
+    start_page: int = 0,
+) -> Tuple[List[str], Iterator[List[str]]]:
+    """
+    Run a SELECT query one page at a time
+
+    The query is rewritten with LIMIT and OFFSET (see `page_query`) and up to
+    `workers` pages are fetched at once. Rows are yielded in page order,
+    starting from `start_page`. If a page cannot be fetched, die with the page
+    number, so the query can be resumed from that page.
+    """
+
+    def fetch(page: int) -> Tuple[int, Tuple[List[str], List[List[str]]]]:
+        try:
+            return (page, _fetch_page(page_query(query, page_size, page), url, repo))
+        except requests.RequestException as err:
+            die(f"Failed to fetch page {page} ({err}), resume with --start-page {page}")
+
+    start = time.monotonic()
+    (_, (fields, first)) = fetch(start_page)
+
+    def rows() -> Iterator[List[str]]:
+        nrows = len(first)
+        yield from first
+        if len(first) == page_size:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pages = itertools.count(start_page + 1)
+                for (page, (_, page_rows)) in ordered_imap(
+                    pool, fetch, pages, window=workers
+                ):
+                    nrows += len(page_rows)
+                    yield from page_rows
+                    if len(page_rows) < page_size:
+                        break
+                    log(f"page {page} done, {nrows} rows")
+        log(f"{nrows} rows in {time.monotonic() - start:.2f}s")
+
+    return (fields, rows())
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Iterable, Callable, Set, Optional
+from typing import Iterable, Callable, Dict, List, Set, Optional
 
 from octofludb.util import underscore, lower, strip
 
@@ -9,20 +9,35 @@ def make_flat_wordfinder(
     alphabet: str = "abcdefghijklmnopqrstuvwxyz",
     depth: int = 1,
     clean: Callable[[str], str] = lambda x: underscore(lower(strip(x))),
+    deep_min_length: int = 0,
 ) -> Callable[[str], Optional[str]]:
     """
     Build a function for finding the closest word in a list. This is not a
     spellchecker, since it will return None if not word is found. Also, it is
     not limited to words, but includes phrases. I may adapt it in the future to
     allow the deletion of words.
+
+    Words up to `depth` edits away (deletions, adjacent transpositions, and
+    replacements or insertions of letters from `alphabet`) are found with a
+    symmetric delete index: a word and a query `depth` edits apart share a
+    string that is at most `depth` deletions away from each. The index is only
+    built when first needed. Candidates are checked with the optimal string
+    alignment distance, the closest word wins and ties go to the
+    alphabetically first word. Queries shorter than `deep_min_length` are
+    only matched within one edit.
     """
 
     WORDS0 = {clean(w) for w in wordlist}
-    WORDSN = [{e: w for w in WORDS0 for e in edits(w, alphabet)}]
-    for i in range(2, depth + 1):
-        WORDSN.append(
-            {e2: w for (e1, w) in WORDSN[-1].items() for e2 in edits(e1, alphabet)}
-        )
+    DELETES: Dict[str, List[str]] = dict()
+    depth = max(depth, 1)
+    letters = set(alphabet)
+
+    def delete_index() -> Dict[str, List[str]]:
+        if not DELETES:
+            for w in sorted(WORDS0):
+                for d in deletes(w, depth):
+                    DELETES.setdefault(d, []).append(w)
+        return DELETES
 
     def wordfinder(word: str) -> Optional[str]:
         clean_word = clean(word)
@@ -30,15 +45,80 @@ def make_flat_wordfinder(
         if clean_word in WORDS0:
             return clean_word
 
-        for words in WORDSN:
-            if clean_word in words:
-                return words[clean_word]
+        limit = depth if len(clean_word) >= deep_min_length else 1
 
-        return None
+        index = delete_index()
+        candidates = {
+            w for d in deletes(clean_word, limit) for w in index.get(d, [])
+        }
+        best: Optional[str] = None
+        best_distance = limit + 1
+        for w in sorted(candidates):
+            distance = osa_distance(w, clean_word, letters, limit=best_distance - 1)
+            if distance < best_distance:
+                best, best_distance = w, distance
+        return best
 
     return wordfinder
 
 
+def deletes(word: str, depth: int = 1) -> Set[str]:
+    """
+    All strings made by deleting up to `depth` characters from a word,
+    including the word itself
+    """
+    found = {word}
+    level = {word}
+    for _ in range(depth):
+        level = {w[:i] + w[i + 1 :] for w in level for i in range(len(w))}
+        found |= level
+    return found
+
+
+def osa_distance(source: str, target: str, alphabet: Set[str], limit: int) -> int:
+    """
+    The optimal string alignment distance for editing `source` into `target`
+
+    Letters may only be inserted or replaced with letters from `alphabet`.
+    Any distance over `limit` is reported as `limit + 1`.
+    """
+    over = limit + 1
+    if abs(len(source) - len(target)) > limit:
+        return over
+    allowed = [c in alphabet for c in target]
+    prev2: List[int] = []
+    prev = [0] * (len(target) + 1)
+    for j in range(1, len(target) + 1):
+        prev[j] = min(prev[j - 1] + 1, over) if allowed[j - 1] else over
+    for i in range(1, len(source) + 1):
+        row = [min(i, over)] + [over] * len(target)
+        # cells more than `limit` off the diagonal are always over the limit
+        for j in range(max(1, i - limit), min(len(target), i + limit) + 1):
+            # delete source[i - 1]
+            cost = prev[j] + 1
+            if source[i - 1] == target[j - 1]:
+                cost = min(cost, prev[j - 1])
+            elif allowed[j - 1]:
+                # replace source[i - 1] with target[j - 1]
+                cost = min(cost, prev[j - 1] + 1)
+            if allowed[j - 1]:
+                # insert target[j - 1]
+                cost = min(cost, row[j - 1] + 1)
+            if (
+                i > 1
+                and j > 1
+                and source[i - 1] == target[j - 2]
+                and source[i - 2] == target[j - 1]
+            ):
+                cost = min(cost, prev2[j - 2] + 1)
+            row[j] = min(cost, over)
+        # cells only depend on the two rows above, so stop once both are over
+        if min(row) > limit and min(prev) > limit:
+            return over
+        prev2, prev = prev, row
+    return prev[-1]
+
+
 def edits(word: str, alphabet: str) -> Set[str]:
     """
     Borrowed directly from Peter Norvig's spell checker (https://norvig.com/spell-correct.html).
@@ -1,6 +1,7 @@
 from __future__ import annotations
-from typing import Optional, Callable, Union, List, Tuple, Set
+from typing import Optional, Callable, Union, List, Tuple, Set, Type
 
+import functools
 import parsec as p
 from octofludb.nomenclature import make_property
 import rdflib
@@ -9,7 +10,20 @@ import re
 from rdflib.namespace import XSD
 
 
-class Token:
+class _Slotted(type):
+    """
+    Give every Token subclass an empty __slots__ unless it declares its own,
+    so that tokens keep their four fields without a per-instance __dict__
+    """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        namespace.setdefault("__slots__", ())
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+
+class Token(metaclass=_Slotted):
+    __slots__ = ("match", "dirty", "field", "clean")
+
     # The parser may either be a function or a parsec parser
     parser: Union[
         Callable[[Optional[str]], Optional[str]], p.Parser[str]
@@ -21,7 +35,31 @@ class Token:
     def __init__(
         self, text: Optional[str], field: Optional[str] = None, na_str: List[str] = []
     ):
-        self.match: Optional[str] = self.testOne(text, na_str=na_str)
+        self._set(text, test_one(type(self), text, na_str=na_str), field, na_str)
+
+    @classmethod
+    def from_match(
+        cls,
+        text: Optional[str],
+        match: Optional[str],
+        field: Optional[str] = None,
+        na_str: List[str] = [],
+    ) -> Token:
+        """
+        Build a token from the result of an earlier `testOne` call on the text
+        """
+        token = cls.__new__(cls)
+        token._set(text, match, field, na_str)
+        return token
+
+    def _set(
+        self,
+        text: Optional[str],
+        match: Optional[str],
+        field: Optional[str],
+        na_str: List[str],
+    ) -> None:
+        self.match: Optional[str] = match
         self.dirty: str = self.set_dirty(text, na_str)
         self.field: Optional[str] = field
         self.clean: Optional[str]
@@ -118,19 +156,75 @@ class Token:
         except p.ParseError:
             return None
 
+    @classmethod
+    def is_good_match(cls, item: str, match: Optional[str]) -> bool:
+        """
+        Does a non-missing item, given its `testOne` result, count towards the
+        goodness of this type?
+        """
+        return match is not None
+
+    @classmethod
+    def goodness_total(cls, nitems: int, nmissing: int) -> int:
+        """
+        The number of items in a column that goodness is a fraction of
+        """
+        return nitems - nmissing
+
     @classmethod
     def goodness(cls, items, na_str=[]):
-        column_matches = [
-            (cls.testOne(item=x, na_str=na_str) is not None)
-            for x in items
-            if not (x in na_str or x is None)
-        ]
-        if len(column_matches) > 0:
-            return sum(column_matches) / len(column_matches)
+        present = [x for x in items if not (x in na_str or x is None)]
+        total = cls.goodness_total(len(items), len(items) - len(present))
+        if total > 0:
+            column_matches = [
+                cls.is_good_match(x, test_one(cls, x, na_str=na_str))
+                for x in present
+            ]
+            return sum(column_matches) / total
         else:
             return 0
 
 
+# The number of classification results remembered by test_one
+TEST_CACHE_SIZE = 100000
+
+# Longer values (sequences, notes, etc) are nearly always unique, so caching
+# them would only hold memory
+TEST_CACHE_MAX_LENGTH = 100
+
+
+@functools.lru_cache(maxsize=TEST_CACHE_SIZE)
+def _test_one(
+    classifier: Type[Token], item: Optional[str], na_str: Tuple[str, ...]
+) -> Optional[str]:
+    return classifier.testOne(item, na_str=list(na_str))
+
+
+def test_one(
+    classifier: Type[Token], item: Optional[str], na_str: List[str] = []
+) -> Optional[str]:
+    """
+    A memoized `classifier.testOne(item, na_str)`
+
+    Tables repeat the same values many times, so results are kept in a
+    bounded LRU cache shared by every classifier. Values longer than
+    TEST_CACHE_MAX_LENGTH are not cached.
+    """
+    if isinstance(item, str) and len(item) > TEST_CACHE_MAX_LENGTH:
+        return classifier.testOne(item, na_str=na_str)
+    try:
+        return _test_one(classifier, item, tuple(na_str))
+    except TypeError:  # unhashable item
+        return classifier.testOne(item, na_str=na_str)
+
+
+def test_cache_info() -> functools._CacheInfo:
+    """
+    Get the hits, misses and size of the test_one cache
+    """
+    return _test_one.cache_info()
+
+
 class Missing(Token):
     parser = lambda x: None
     typename = "missing"
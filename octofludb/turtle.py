@@ -0,0 +1,46 @@
+from __future__ import annotations
+from typing import Iterable, List, TextIO, Tuple
+
+import sys
+from rdflib.term import Node
+
+
+def sorted_triples(
+    triples: Iterable[Tuple[Node, Node, Node]]
+) -> List[Tuple[Node, Node, Node]]:
+    """
+    Sort triples by subject, predicate and object
+
+    This gives unordered collections of triples (such as sets) a stable order
+    with all triples of a subject next to each other.
+    """
+    return sorted(triples, key=lambda t: (t[0].n3(), t[1].n3(), t[2].n3()))
+
+
+def write_turtle(
+    triples: Iterable[Tuple[Node, Node, Node]], outfile: TextIO = sys.stdout
+) -> int:
+    """
+    Write triples to a turtle file as they are produced
+
+    Nothing is held in memory beyond the current triple. Consecutive triples
+    that share a subject are grouped into a single statement. Terms are written
+    in their full N-Triples form, so no prefix header is needed and the output
+    of several calls may be concatenated.
+
+    Return the number of triples written
+    """
+    last_subject = None
+    ntriples = 0
+    for (s, p, o) in triples:
+        if s == last_subject:
+            outfile.write(f" ;\n    {p.n3()} {o.n3()}")
+        else:
+            if last_subject is not None:
+                outfile.write(" .\n")
+            outfile.write(f"{s.n3()} {p.n3()} {o.n3()}")
+            last_subject = s
+        ntriples += 1
+    if last_subject is not None:
+        outfile.write(" .\n")
+    return ntriples
@@ -1,25 +1,62 @@
 from __future__ import annotations
-from typing import TextIO, NoReturn, Optional, List, Set, Tuple
+from typing import (
+    TYPE_CHECKING,
+    TextIO,
+    NoReturn,
+    Optional,
+    List,
+    Set,
+    Tuple,
+    Iterable,
+    Iterator,
+)
 
 import click
 import collections
 import sys
 import os
-from rdflib import Graph
-from rdflib.term import Node
-from octofludb.util import log, safeAdd
+from octofludb.util import log, safeAdd, die, atomic_open
 from octofludb.version import __version__
 
+# Only light modules are imported here, everything else is imported by the
+# commands that need it so that the CLI starts quickly. See `--profile-startup`.
+if TYPE_CHECKING:
+    from rdflib import Graph
+    from rdflib.term import Node
+    from octofludb.cache import GenbankCache, AccessionIndex, UploadLedger, QueryCache
+
 
 def open_graph() -> Graph:
+    from rdflib import Graph
     from octofludb.nomenclature import manager
 
     return Graph(namespace_manager=manager)
 
 
 def with_graph(
-    triples: Set[Tuple[Node, Node, Node]], outfile: TextIO = sys.stdout
+    triples: Iterable[Tuple[Node, Node, Node]],
+    outfile: TextIO = sys.stdout,
+    pretty: bool = False,
 ) -> None:
+    """
+    Write triples as turtle
+
+    By default, triples are streamed to the output as they are produced. If
+    `pretty` is set, all triples are first loaded into an rdflib graph and
+    serialized together. This yields compact, prefixed and sorted output at the
+    cost of holding several copies of the data in memory. Sets of triples are
+    sorted, so the streamed output is the same from one run to the next.
+    """
+    if not pretty:
+        from octofludb.turtle import write_turtle, sorted_triples
+
+        if isinstance(triples, (set, frozenset)):
+            triples = sorted_triples(triples)
+        log("Writing turtle triples ... ", end="")
+        ntriples = write_turtle(triples, outfile=outfile)
+        log(f"wrote {ntriples} triples")
+        return None
+
     g = open_graph()
 
     # Add the new triples
@@ -73,6 +110,70 @@ class OrderedGroup(click.Group):
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
+# Modules that are only imported once a command runs, reported by
+# `--profile-startup`
+DEFERRED_IMPORTS = [
+    "rdflib",
+    "pgraphdb",
+    "octofludb.nomenclature",
+    "octofludb.classes",
+    "octofludb.recipes",
+    "octofludb.formatting",
+    "octofludb.entrez",
+]
+
+
+def import_times(modules: List[str]) -> List[Tuple[int, str, float]]:
+    """
+    Import modules in a fresh interpreter, return (depth, module, cumulative
+    milliseconds) for every import, in the order the imports finished
+    """
+    import subprocess
+
+    code = "\n".join(
+        ["import sys", "print('--start--', file=sys.stderr, flush=True)"]
+        + [f"import {module}" for module in modules]
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    times = []
+    started = False
+    for line in result.stderr.splitlines():
+        if line == "--start--":
+            started = True
+        # lines look like "import time:  self [us] | cumulative | imported package"
+        # with package names indented two spaces per level of nesting
+        if not started or not line.startswith("import time:") or "[us]" in line:
+            continue
+        (_, cumulative, name) = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((depth, name.strip(), int(cumulative) / 1000))
+    return times
+
+
+def profile_startup(ctx: click.Context, param: click.Parameter, value: bool) -> None:
+    if not value or ctx.resilient_parsing:
+        return
+
+    times = import_times(["octofludb.ui"] + DEFERRED_IMPORTS)
+
+    top = [i for (i, (depth, _, _)) in enumerate(times) if depth == 0]
+    ui = [i for i in top if times[i][1] == "octofludb.ui"][0]
+    startup = sum(times[i][2] for i in top if i <= ui)
+    print(f"Startup imports: {startup:.1f} ms")
+    children = [t for t in times[:ui] if t[0] == 1 and t[1] != "octofludb"]
+    for (_, name, ms) in sorted(children, key=lambda t: -t[2])[0:10]:
+        print(f"  {name:<30} {ms:8.1f} ms")
+    print("Imported when a command runs:")
+    for i in top:
+        if i > ui:
+            print(f"  {times[i][1]:<30} {times[i][2]:8.1f} ms")
+    ctx.exit()
+
+
 url_opt = click.option("--url", help="GraphDB URL", default="http://localhost:7200")
 
 filename_arg = click.argument("filename", type=click.Path(exists=True))
@@ -112,10 +213,56 @@ fasta_opt = click.option(
     help="Return query as a fasta file where last column is sequence",
 )
 
+stream_opt = click.option(
+    "--stream",
+    is_flag=True,
+    help="Fetch results as CSV and write each row as it arrives instead of loading the full result first",
+)
+
+page_size_opt = click.option(
+    "--page-size",
+    help="Fetch the results in ordered pages of this many rows (adds LIMIT/OFFSET to the query)",
+    type=click.IntRange(min=1),
+)
+
+start_page_opt = click.option(
+    "--start-page",
+    help="With --page-size, the first page to fetch (to resume a failed query)",
+    default=0,
+    type=click.IntRange(min=0),
+)
+
+page_workers_opt = click.option(
+    "--workers",
+    help="With --page-size, the number of pages to fetch at once",
+    default=4,
+    type=click.IntRange(min=1),
+)
+
+no_cache_opt = click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Rerun the query even if its results are in the local query cache",
+)
+
 delimiter_opt = click.option(
     "--delimiter", help="The delimiter between fields in the header", default="|"
 )
 
+jobs_opt = click.option(
+    "--jobs",
+    help="Number of worker processes",
+    default=1,
+    type=click.IntRange(min=1),
+)
+
+pretty_opt = click.option(
+    "--pretty",
+    is_flag=True,
+    default=False,
+    help="Build the full graph in memory and write sorted, prefixed turtle (slower and uses much more memory than the default streaming output)",
+)
+
 
 @click.command(
     name="init",
@@ -134,7 +281,7 @@ def init_cmd(url: str, repo: str) -> NoReturn:
         os.path.dirname(__file__), "data", "octofludb-config.ttl"
     )
     try:
-        db.make_repo(config=config_file, url=url)
+        response = db.make_repo(config=config_file, url=url)
     except requests.exceptions.ConnectionError:
         print(f"Could not connect to a GraphDB database at {url}", file=sys.stderr)
         sys.exit(1)
@@ -157,6 +304,13 @@ def init_cmd(url: str, repo: str) -> NoReturn:
 
     script.initialize_config_file()
 
+    if response.ok:
+        # forget anything recorded about an earlier database at this location
+        stores = (open_upload_ledger(), open_accession_index(), open_query_cache())
+        for store in stores:
+            if store is not None:
+                store.clear(url, repo)
+
     sys.exit(0)
 
 
@@ -164,7 +318,7 @@ def upload_gisaid(config: dict, url: str, repo: str) -> List[str]:
     import octofludb.script as script
     import octofludb.recipes as recipe
 
-    uploaded_files = []
+    outfiles = []
 
     epiflu_metafiles = script.epiflu_meta_files(config)
     skipped_meta = 0
@@ -174,14 +328,14 @@ def upload_gisaid(config: dict, url: str, repo: str) -> List[str]:
             if os.path.exists(outfile) and os.path.getsize(outfile) > 0:
                 skipped_meta += 1
             else:
-                with open(outfile, "w") as fo:
+                with atomic_open(outfile) as fo:
                     with_graph(recipe.mk_gis(epiflu_metafile), outfile=fo)
-                uploaded_files += upload([outfile], url=url, repo=repo)
+            outfiles.append(outfile)
     else:
         log("No epiflu metafiles found")
     if skipped_meta > 0:
         log(
-            f"Skipped {str(skipped_meta)} epiflu meta files where existing non-empty turtle files were found in the build directory"
+            f"Skipped preparing {str(skipped_meta)} epiflu meta files where existing non-empty turtle files were found in the build directory"
         )
 
     epiflu_fastafiles = script.epiflu_fasta_files(config)
@@ -192,23 +346,22 @@ def upload_gisaid(config: dict, url: str, repo: str) -> List[str]:
             if os.path.exists(outfile) and os.path.getsize(outfile) > 0:
                 skipped_fasta += 1
             else:
-                with open(outfile, "w") as f:
+                with atomic_open(outfile) as f:
                     prep_fasta(filename=infile, outfile=f)
-                    uploaded_files += upload([outfile], url=url, repo=repo)
+            outfiles.append(outfile)
     else:
         log("No epiflu fasta found")
 
     if skipped_fasta > 0:
         log(
-            f"Skipped {str(skipped_fasta)} epiflu fasta files where existing non-empty turtle files were found in the build directory"
+            f"Skipped preparing {str(skipped_fasta)} epiflu fasta files where existing non-empty turtle files were found in the build directory"
         )
 
-    return uploaded_files
+    return upload(outfiles, url=url, repo=repo)
 
 
 def upload_classifications(url: str, repo: str) -> List[str]:
     import octofludb.script as script
-    import pgraphdb as db
 
     # octoflu classifications of unclassified swine
     # * retrieve unclassified strains
@@ -242,7 +395,7 @@ def upload_classifications(url: str, repo: str) -> List[str]:
     constellation_turtles = "constellations.ttl"
 
     delete_constellations = script.get_data_file("delete-constellations.rq")
-    db.update(sparql_file=delete_constellations, url=url, repo_name=repo)
+    update(delete_constellations, url=url, repo=repo)
 
     with open(constellation_table, "w") as constout:
         make_const(url=url, repo=repo, outfile=constout)
@@ -250,7 +403,10 @@ def upload_classifications(url: str, repo: str) -> List[str]:
     with open(constellation_turtles, "w") as turtleout:
         prep_table(constellation_table, outfile=turtleout)
 
-    uploaded_constellations = upload([constellation_turtles], url=url, repo=repo)
+    # the old constellations were just deleted, so always send the new ones
+    uploaded_constellations = upload(
+        [constellation_turtles], url=url, repo=repo, force=True
+    )
 
     return uploaded_unclassified + uploaded_constellations
 
@@ -363,6 +519,7 @@ def upload_motifs(url: str, repo: str) -> List[str]:
     default=False,
     help="Upload tags as defined in the config file",
 )
+@jobs_opt
 @url_opt
 @repo_name_opt
 def pull_cmd(
@@ -373,6 +530,7 @@ def pull_cmd(
     no_motifs: bool,
     include_gisaid: bool,
     include_tags: bool,
+    jobs: int,
     url: str,
     repo: str,
 ) -> NoReturn:
@@ -396,15 +554,16 @@ def pull_cmd(
     if not no_schema:
         # upload ontological schema
         schema_file = script.get_data_file("schema.ttl")  #
-        upload([schema_file], url=url, repo=repo)
-
-        # upload geological relationships
-        upload([script.get_data_file("geography.ttl")], url=url, repo=repo)[0]
+        # upload along with the geological relationships
+        geography_file = script.get_data_file("geography.ttl")
+        upload([schema_file, geography_file], url=url, repo=repo)
 
     if nmonths > 0:
         # update genbank (take a parameter telling how far back to go)
         # this command fills the current directory with .gb* files
-        gb_turtles = prep_update_gb(minyear=1900, maxyear=2121, nmonths=nmonths)
+        gb_turtles = prep_update_gb(
+            minyear=1900, maxyear=2121, nmonths=nmonths, jobs=jobs, url=url, repo=repo
+        )
         upload(gb_turtles, url=url, repo=repo)
 
     if include_gisaid:
@@ -421,12 +580,14 @@ def pull_cmd(
 
     if include_tags:
         # load all tags
+        tag_turtles = []
         for (tag, basename) in config["tags"].items():
             for filename in script.tag_files(config, tag):
                 outfile = filename + ".ttl"
                 with open(outfile, "w") as f:
                     prep_tag(tag, filename, outfile=f)
-                upload([outfile], url=url, repo=repo)
+                tag_turtles.append(outfile)
+        upload(tag_turtles, url=url, repo=repo)
 
     os.chdir(cwd)
 
@@ -439,14 +600,44 @@ def fmt_query_cmd(
     fasta: bool,
     url: str,
     repo: str,
+    stream: bool = False,
+    page_size: Optional[int] = None,
+    start_page: int = 0,
+    workers: int = 4,
+    cached: bool = False,
     outfile: TextIO = sys.stdout,
 ) -> TextIO:
     import octofludb.formatting as formatting
-    import pgraphdb as db
 
-    results = db.sparql_query(
-        sparql_file=sparql_filename, url=url, repo_name=repo
-    ).convert()
+    if page_size is not None:
+        from octofludb.sparql import select_pages
+
+        with open(sparql_filename, "r") as fh:
+            (fields, rows) = select_pages(
+                fh.read(),
+                url=url,
+                repo=repo,
+                page_size=page_size,
+                workers=workers,
+                start_page=start_page,
+            )
+        # a resumed query is appended to earlier output, so has no header
+        header = header and start_page == 0
+        stream = True
+    elif stream:
+        from octofludb.sparql import select_rows
+
+        with open(sparql_filename, "r") as fh:
+            (fields, rows) = select_rows(fh.read(), url=url, repo=repo)
+
+    if stream:
+        if fasta:
+            formatting.write_rows_as_fasta(fields, rows, outfile=outfile)
+        else:
+            formatting.write_rows_as_table(fields, rows, header=header, outfile=outfile)
+        return outfile
+
+    results = select_json(sparql_filename, url=url, repo=repo, cached=cached)
     if fasta:
         formatting.write_as_fasta(results, outfile=outfile)
     else:
@@ -463,6 +654,10 @@ def fmt_query_cmd(
 @fasta_opt
 @url_opt
 @repo_name_opt
+@stream_opt
+@page_size_opt
+@start_page_opt
+@page_workers_opt
 def query_cmd(*args, **kwargs):
     """
     Submit a SPARQL query to octofludb
@@ -545,9 +740,7 @@ def update_cmd(sparql_filename: str, url: str, repo: str) -> NoReturn:
     """
     Submit a SPARQL delete or insert query to octofludb
     """
-    import pgraphdb as db
-
-    db.update(sparql_file=sparql_filename, url=url, repo_name=repo)
+    update(sparql_filename, url=url, repo=repo, clear_ledger=True)
 
     sys.exit(0)
 
@@ -556,28 +749,81 @@ def update_cmd(sparql_filename: str, url: str, repo: str) -> NoReturn:
     name="upload",
 )
 @all_the_turtles
+@click.option(
+    "--workers",
+    help="Number of files to upload at once",
+    default=4,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Upload files even if identical files have already been uploaded",
+)
 @url_opt
 @repo_name_opt
-def upload_cmd(turtle_filenames: List[str], url: str, repo: str) -> NoReturn:
+def upload_cmd(
+    turtle_filenames: List[str], workers: int, force: bool, url: str, repo: str
+) -> NoReturn:
     """
     Upload one or more turtle files to the database
+
+    Small files are concatenated and sent together, several requests are sent
+    at once. Files whose contents have already been uploaded to this database
+    are skipped.
     """
-    upload(turtle_filenames, url, repo)
+    upload(turtle_filenames, url, repo, workers=workers, force=force)
 
     sys.exit(0)
 
 
-def upload(turtle_filenames: List[str], url: str, repo: str) -> List[str]:
-    import pgraphdb as db
+def upload(
+    turtle_filenames: List[str],
+    url: str,
+    repo: str,
+    workers: int = 4,
+    force: bool = False,
+) -> List[str]:
     import octofludb.script as script
+    from octofludb.upload import upload_files
+
+    index = open_accession_index()
+    ledger = open_upload_ledger()
+
+    filenames = []
+    md5sums = dict()
+    for path in turtle_filenames:
+        for filename in script.expandpath(path):
+            md5sums[filename] = script.file_md5sum(filename)
+            if force or ledger is None:
+                filenames.append(filename)
+            elif not ledger.contains(url, repo, md5sums[filename]):
+                filenames.append(filename)
+
+    skipped = len(md5sums) - len(filenames)
+    if skipped > 0:
+        log(
+            f"Skipping {skipped} files that have already been uploaded (use --force to upload them anyway)"
+        )
+
+    def record_upload(filename: str) -> None:
+        if ledger is not None:
+            ledger.add(url, repo, md5sums[filename], filename)
+        # GenBank turtles from `prep update_gb` list their accessions in a
+        # sidecar file, record these in the local accession index
+        if index is not None and os.path.exists(filename + ".acc"):
+            with open(filename + ".acc", "r") as fh:
+                index.add(url, repo, fh.read().split())
 
-    files = []
-    for filenames in turtle_filenames:
-        for filename in script.expandpath(filenames):
-            log(f"loading file: {filename}")
-            db.load_data(url=url, repo_name=repo, turtle_file=filename)
-            files.append(filename)
-    return files
+    log(f"loading {len(filenames)} files")
+    try:
+        return upload_files(
+            filenames, url=url, repo=repo, workers=workers, on_loaded=record_upload
+        )
+    finally:
+        if filenames:
+            database_changed(url, repo)
 
 
 # ===== prep subcommands ====
@@ -588,16 +834,19 @@ def upload(turtle_filenames: List[str], url: str, repo: str) -> List[str]:
 )
 @click.argument("tag", type=str)
 @filename_arg
-def prep_tag_cmd(tag: str, filename: str) -> NoReturn:
+@pretty_opt
+def prep_tag_cmd(tag: str, filename: str, pretty: bool) -> NoReturn:
     """
     Associate list of IDs with a tag
     """
-    prep_tag(tag, filename)
+    prep_tag(tag, filename, pretty=pretty)
 
     sys.exit(0)
 
 
-def prep_tag(tag: str, filename: str, outfile: TextIO = sys.stdout) -> None:
+def prep_tag(
+    tag: str, filename: str, outfile: TextIO = sys.stdout, pretty: bool = False
+) -> None:
     import datetime as datetime
     from octofludb.nomenclature import make_uri, make_tag_uri, make_literal, P
     from octofludb.util import file_str
@@ -611,10 +860,7 @@ def prep_tag(tag: str, filename: str, outfile: TextIO = sys.stdout) -> None:
         for identifier in (s.strip() for s in fh.readlines()):
             safeAdd(g, make_uri(identifier), P.tag, taguri)
 
-        turtles = open_graph().update(g).commit().serialize(format="turtle")
-
-        for line in turtles.splitlines():
-            print(line, file=outfile)
+        with_graph(g, outfile=outfile, pretty=pretty)
 
     return None
 
@@ -623,7 +869,8 @@ def prep_tag(tag: str, filename: str, outfile: TextIO = sys.stdout) -> None:
     name="ivr",
 )
 @filehandle_r_arg
-def prep_ivr_cmd(filename: TextIO) -> NoReturn:
+@pretty_opt
+def prep_ivr_cmd(filename: TextIO, pretty: bool) -> NoReturn:
     """
     Translate an IVR table to RDF.
 
@@ -632,7 +879,7 @@ def prep_ivr_cmd(filename: TextIO) -> NoReturn:
     """
     import octofludb.recipes as recipe
 
-    with_graph(recipe.mk_influenza_na(filename))
+    with_graph(recipe.mk_influenza_na(filename), pretty=pretty)
 
     sys.exit(0)
 
@@ -641,14 +888,15 @@ def prep_ivr_cmd(filename: TextIO) -> NoReturn:
     name="ird",
 )
 @filehandle_r_arg
-def prep_ird_cmd(filename: TextIO) -> NoReturn:
+@pretty_opt
+def prep_ird_cmd(filename: TextIO, pretty: bool) -> NoReturn:
     """
     Translate an IRD table to RDF.
     """
 
     import octofludb.recipes as recipe
 
-    with_graph(recipe.mk_ird(filename))
+    with_graph(recipe.mk_ird(filename), pretty=pretty)
 
     sys.exit(0)
 
@@ -657,7 +905,8 @@ def prep_ird_cmd(filename: TextIO) -> NoReturn:
     name="gis",
 )
 @filename_arg
-def prep_gis_cmd(filename: str) -> NoReturn:
+@pretty_opt
+def prep_gis_cmd(filename: str, pretty: bool) -> NoReturn:
     """
     Translate a Gisaid metadata excel file to RDF.
 
@@ -665,40 +914,203 @@ def prep_gis_cmd(filename: str) -> NoReturn:
     """
     import octofludb.recipes as recipe
 
-    with_graph(recipe.mk_gis(filename=filename))
+    with_graph(recipe.mk_gis(filename=filename), pretty=pretty)
 
     sys.exit(0)
 
 
-def _mk_gbids_cmd(gbids: List[str] = []) -> Set[Tuple[Node, Node, Node]]:
-    import octofludb.entrez as entrez
+def open_genbank_cache() -> Optional[GenbankCache]:
+    """
+    Open the local GenBank record cache if one is configured
+    """
+    import octofludb.script as script
+    from octofludb.cache import GenbankCache
+
+    if not os.path.exists(script.octofludbHome()):
+        return None
+    path = script.genbank_cache_path(script.load_config_file())
+    if path is None:
+        return None
+    return GenbankCache(path)
+
+
+def open_accession_index() -> Optional[AccessionIndex]:
+    """
+    Open the local index of uploaded GenBank accessions
+    """
+    import octofludb.script as script
+    from octofludb.cache import AccessionIndex
+
+    if not os.path.exists(script.octofludbHome()):
+        return None
+    return AccessionIndex(os.path.join(script.octofludbHome(), "accessions.sqlite"))
+
+
+def open_upload_ledger() -> Optional[UploadLedger]:
+    """
+    Open the local record of uploaded turtle files
+    """
+    import octofludb.script as script
+    from octofludb.cache import UploadLedger
+
+    if not os.path.exists(script.octofludbHome()):
+        return None
+    return UploadLedger(os.path.join(script.octofludbHome(), "uploads.sqlite"))
+
+
+def open_query_cache() -> Optional[QueryCache]:
+    """
+    Open the local cache of query results
+    """
+    import octofludb.script as script
+    from octofludb.cache import QueryCache
+
+    if not os.path.exists(script.octofludbHome()):
+        return None
+    (ttl, max_bytes) = script.query_cache_limits(script.load_config_file())
+    return QueryCache(
+        os.path.join(script.octofludbHome(), "queries.sqlite"),
+        ttl=ttl,
+        max_bytes=max_bytes,
+    )
+
+
+def database_changed(url: str, repo: str) -> None:
+    """
+    Record that the database has changed, so cached query results are stale
+    """
+    cache = open_query_cache()
+    if cache is not None:
+        cache.bump(url, repo)
+
+
+def update(
+    sparql_filename: str, url: str, repo: str, clear_ledger: bool = False
+) -> None:
+    """
+    Submit a SPARQL update to the database
+
+    If the update may delete triples that earlier uploads added, set
+    `clear_ledger` so the upload ledger of the database is cleared and the
+    files are sent again on their next upload.
+    """
+    import pgraphdb as db
+
+    try:
+        db.update(sparql_file=sparql_filename, url=url, repo_name=repo)
+    finally:
+        database_changed(url, repo)
+        ledger = open_upload_ledger() if clear_ledger else None
+        if ledger is not None:
+            ledger.clear(url, repo)
+
+
+def select_json(
+    sparql_filename: str, url: str, repo: str, cached: bool = True
+) -> dict:
+    """
+    Submit a SPARQL SELECT query and return the SPARQL JSON results
+
+    If `cached` is True, results are served from (and stored in) the local
+    query cache.
+    """
+    import pgraphdb as db
+
+    cache = open_query_cache() if cached else None
+    if cache is not None:
+        with open(sparql_filename, "r") as fh:
+            query = fh.read()
+        results = cache.get(query, url=url, repo=repo)
+        if results is not None:
+            log(f"Using cached results of {os.path.basename(sparql_filename)}")
+            return results
+    results = db.sparql_query(
+        sparql_file=sparql_filename, url=url, repo_name=repo
+    ).convert()
+    if cache is not None:
+        cache.put(query, url=url, repo=repo, results=results)
+    return results
+
+
+def select_bindings(
+    sparql_filename: str, url: str, repo: str, cached: bool = True
+) -> Iterable[dict]:
+    """
+    Submit a SPARQL SELECT query and return its result bindings
+
+    Results are served from (and stored in) the local query cache if `cached`
+    is True and the cache is available. Otherwise the rows are streamed from
+    the database as they arrive rather than loaded all at once.
+    """
+    if cached and open_query_cache() is not None:
+        results = select_json(sparql_filename, url=url, repo=repo)
+        return results["results"]["bindings"]
+
+    from octofludb.sparql import select_rows, rows_as_bindings
+
+    with open(sparql_filename, "r") as fh:
+        (fields, rows) = select_rows(fh.read(), url=url, repo=repo)
+    return rows_as_bindings(fields, rows)
+
+
+def _parse_gb_batches(
+    batches: Iterable[bytes], jobs: int = 1
+) -> Iterator[Tuple[Node, Node, Node]]:
+    """
+    Parse GenBank XML batches, yielding triples one batch at a time
+
+    If `jobs` is greater than 1, batches are parsed in a pool of worker
+    processes, so parsing overlaps with downloading.
+    """
+    from concurrent.futures import ProcessPoolExecutor
     import octofludb.genbank as gb
     import octofludb.script as script
+    from octofludb.util import ordered_imap, uniq_window
+    from octofludb.turtle import sorted_triples
 
-    error_msgs = []
+    error_msgs: List[str] = []
 
-    all_triples = set()
+    def _parse(batches):
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                yield from ordered_imap(pool, gb.parse_gb_xml, batches, window=2 * jobs)
+        else:
+            yield from (gb.parse_gb_xml(xml) for xml in batches)
+
+    def _triples():
+        for (triples, batch_errors) in _parse(batches):
+            error_msgs.extend(batch_errors)
+            # each batch is parsed into a set, sort it for a stable output
+            yield from sorted_triples(triples)
 
-    for gb_metas in entrez.get_gbs(gbids):
-        for gb_meta in gb_metas:
-            (triples, error_msg) = gb.make_gb_meta_triples(gb_meta)
-            if error_msg:
-                error_msgs.append(error_msg)
-            # commit the current batch (say of 1000 entries)
-            all_triples.update(triples)
+    yield from uniq_window(_triples())
 
     if len(error_msgs) > 0:
         logpath = script.error_log_entry(error_msgs, "failed_genbank_parses.txt")
         log(f"{len(error_msgs)} genbank entries could not be parsed, see {logpath}")
 
-    return all_triples
+
+def _mk_gbids_cmd(
+    gbids: List[str] = [], jobs: int = 1, cache: Optional[GenbankCache] = None
+) -> Iterator[Tuple[Node, Node, Node]]:
+    """
+    Fetch and parse genbank records, yielding triples one batch at a time
+
+    Records found in the cache are not downloaded again. Batches are
+    downloaded concurrently in threads.
+    """
+    import octofludb.entrez as entrez
+
+    return _parse_gb_batches(entrez.get_gb_xml(gbids, cache=cache), jobs=jobs)
 
 
 @click.command(
     name="gbids",
 )
 @filename_arg
-def prep_gbids_cmd(filename: str) -> NoReturn:
+@jobs_opt
+@pretty_opt
+def prep_gbids_cmd(filename: str, jobs: int, pretty: bool) -> NoReturn:
     """
     Retrieve data for a list of genbank ids.
 
@@ -707,7 +1119,30 @@ def prep_gbids_cmd(filename: str) -> NoReturn:
     with open(filename, "r") as fh:
         gbids = [gbid.strip() for gbid in fh]
     log("Retrieving and parsing genbank ids from 'filename'")
-    with_graph(_mk_gbids_cmd(gbids=gbids))
+    with_graph(
+        _mk_gbids_cmd(gbids=gbids, jobs=jobs, cache=open_genbank_cache()),
+        pretty=pretty,
+    )
+
+    sys.exit(0)
+
+
+@click.command(name="replay_gb")
+@jobs_opt
+@pretty_opt
+def prep_replay_gb_cmd(jobs: int, pretty: bool) -> NoReturn:
+    """
+    Rebuild GenBank triples from the local GenBank record cache.
+
+    This needs no network access. It is useful for regenerating GenBank
+    turtle files after changes to the GenBank parser. The cache is set by the
+    `genbank_backup` field in the config file.
+    """
+    cache = open_genbank_cache()
+    if cache is None:
+        die("No GenBank cache is configured, see `genbank_backup` in the config file")
+    log(f"Replaying {len(cache)} cached GenBank records")
+    with_graph(_parse_gb_batches(cache.batches(), jobs=jobs), pretty=pretty)
 
     sys.exit(0)
 
@@ -733,23 +1168,79 @@ def prep_gbids_cmd(filename: str) -> NoReturn:
     default=1440,
     type=click.IntRange(min=1, max=9999),
 )
-def prep_update_gb_cmd(minyear: int, maxyear: int, nmonths: int) -> NoReturn:
+@click.option(
+    "--reindex",
+    is_flag=True,
+    default=False,
+    help="Rebuild the local accession index from the database",
+)
+@jobs_opt
+@url_opt
+@repo_name_opt
+def prep_update_gb_cmd(
+    minyear: int,
+    maxyear: int,
+    nmonths: int,
+    reindex: bool,
+    jobs: int,
+    url: str,
+    repo: str,
+) -> NoReturn:
     """
     Retrieve any missing genbank records. Results are stored in files with the prefix '.gb_###.ttl'
+
+    The accessions already in the database are read from a local index that is
+    updated whenever these files are uploaded. The index is built from the
+    database on first use, or when --reindex is given.
     """
-    prep_update_gb(minyear, maxyear, nmonths)
+    prep_update_gb(
+        minyear, maxyear, nmonths, jobs=jobs, url=url, repo=repo, reindex=reindex
+    )
 
     sys.exit(0)
 
 
-def prep_update_gb(minyear: int, maxyear: int, nmonths: int) -> List[str]:
+def _record_accessions(
+    triples: Iterable[Tuple[Node, Node, Node]], accessions: List[str]
+) -> Iterator[Tuple[Node, Node, Node]]:
+    from octofludb.nomenclature import P
+
+    for (s, p, o) in triples:
+        if p == P.gb:
+            accessions.append(str(o))
+        yield (s, p, o)
+
+
+def prep_update_gb(
+    minyear: int,
+    maxyear: int,
+    nmonths: int,
+    jobs: int = 1,
+    url: str = "http://localhost:7200",
+    repo: str = "octofludb",
+    reindex: bool = False,
+) -> List[str]:
     from octofludb.entrez import missing_acc_by_date
     import octofludb.colors as colors
 
     outfiles = []
 
+    cache = open_genbank_cache()
+
+    index = open_accession_index()
+    if index is not None and reindex:
+        from octofludb.entrez import get_all_acc_in_db
+
+        log("Rebuilding the local accession index from the database ...")
+        index.rebuild(url, repo, get_all_acc_in_db(url=url, repo=repo))
+
     for date, missing_acc in missing_acc_by_date(
-        min_year=minyear, max_year=maxyear, nmonths=nmonths
+        min_year=minyear,
+        max_year=maxyear,
+        nmonths=nmonths,
+        url=url,
+        repo=repo,
+        index=index,
     ):
         if missing_acc:
             outfile = ".gb_" + date.replace("/", "-") + ".ttl"
@@ -757,9 +1248,20 @@ def prep_update_gb(minyear: int, maxyear: int, nmonths: int) -> List[str]:
                 log(f"GenBank turtle file for '{str(date)}' already exists, skipping")
             else:
                 log(colors.good(f"Updating {date} ..."))
-                with open(outfile, "w") as fh:
-                    with_graph(_mk_gbids_cmd(gbids=missing_acc), outfile=fh)
-                outfiles.append(outfile)
+                accessions: List[str] = []
+                with atomic_open(outfile) as fh:
+                    with_graph(
+                        _record_accessions(
+                            _mk_gbids_cmd(gbids=missing_acc, jobs=jobs, cache=cache),
+                            accessions,
+                        ),
+                        outfile=fh,
+                    )
+                    with open(outfile + ".acc", "w") as fa:
+                        fa.write("".join(acc + "\n" for acc in accessions))
+            # existing files are included, the upload ledger skips any that
+            # were already uploaded
+            outfiles.append(outfile)
         else:
             log(colors.good(f"Up-to-date for {date}"))
 
@@ -771,7 +1273,8 @@ def prep_update_gb(minyear: int, maxyear: int, nmonths: int) -> List[str]:
 )
 @tag_arg_opt
 @filehandle_r_arg
-def prep_blast_cmd(tag: str, filename: TextIO) -> NoReturn:
+@pretty_opt
+def prep_blast_cmd(tag: str, filename: TextIO, pretty: bool) -> NoReturn:
     """
     Translate BLAST results into RDF.
 
@@ -780,7 +1283,7 @@ def prep_blast_cmd(tag: str, filename: TextIO) -> NoReturn:
     import octofludb.recipes as recipe
 
     log(f"Retrieving and parsing blast results from '{filename}'")
-    with_graph(recipe.mk_blast(filename, tag=tag))
+    with_graph(recipe.mk_blast(filename, tag=tag), pretty=pretty)
 
     sys.exit(0)
 
@@ -816,6 +1319,11 @@ exclude_opt = click.option(
     "--exclude", help="Remove these tokens (comma-delimited list)", default=""
 )
 na_opt = click.option("--na", help="The string that represents a missing value")
+chunk_size_opt = click.option(
+    "--chunk-size",
+    help="Infer column types from the first N rows, then read the rest of the table N rows at a time",
+    type=click.IntRange(min=1),
+)
 
 
 @click.command(
@@ -828,6 +1336,9 @@ na_opt = click.option("--na", help="The string that represents a missing value")
 @click.option("--levels", help="levels")
 @na_opt
 @segment_key_opt
+@chunk_size_opt
+@jobs_opt
+@pretty_opt
 def prep_table_cmd(*args, **kwargs):
     """
     Translate a table to RDF
@@ -843,7 +1354,10 @@ def prep_table(
     levels: Optional[str] = None,
     na: Optional[str] = None,
     segment_key: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    jobs: int = 1,
     outfile: TextIO = sys.stdout,
+    pretty: bool = False,
 ) -> None:
     """
     Translate a table to RDF
@@ -853,7 +1367,7 @@ def prep_table(
 
     (inc, exc, levelsProc) = process_tablelike(include, exclude, levels)
 
-    def _mk_table_cmd(fh: TextIO) -> Set[Tuple[Node, Node, Node]]:
+    def _mk_table_cmd(fh: TextIO) -> Iterator[Tuple[Node, Node, Node]]:
         if segment_key is None:
             return IrregularSegmentTable(
                 text=fh,
@@ -863,7 +1377,8 @@ def prep_table(
                 log=True,
                 levels=levelsProc,
                 na_str=make_na(na),
-            ).connect()
+                chunk_size=chunk_size,
+            ).triples(jobs=jobs)
         else:
             return classes.Table(
                 text=fh,
@@ -873,10 +1388,11 @@ def prep_table(
                 log=True,
                 levels=levelsProc,
                 na_str=make_na(na),
-            ).connect()
+                chunk_size=chunk_size,
+            ).triples(jobs=jobs)
 
     with open(filename, "r") as fi:
-        return with_graph(_mk_table_cmd(fi), outfile=outfile)
+        return with_graph(_mk_table_cmd(fi), outfile=outfile, pretty=pretty)
 
 
 @click.command(
@@ -888,6 +1404,8 @@ def prep_table(
 @include_opt
 @exclude_opt
 @na_opt
+@jobs_opt
+@pretty_opt
 def prep_fasta_cmd(*args, **kwargs) -> NoReturn:
     """
     Translate a fasta file to RDF.
@@ -907,11 +1425,13 @@ def prep_fasta(
     include: Optional[str] = None,
     exclude: Optional[str] = None,
     na: Optional[str] = None,
+    jobs: int = 1,
     outfile: TextIO = sys.stdout,
+    pretty: bool = False,
 ) -> None:
     import octofludb.classes as classes
 
-    def _mk_fasta_cmd(fh: TextIO) -> Set[Tuple[Node, Node, Node]]:
+    def _mk_fasta_cmd(fh: TextIO) -> Iterator[Tuple[Node, Node, Node]]:
         (inc, exc, levels) = process_tablelike(include, exclude, None)
         return classes.Ragged(
             text=fh,
@@ -921,10 +1441,10 @@ def prep_fasta(
             log=True,
             levels=levels,
             na_str=make_na(na),
-        ).connect()
+        ).triples(jobs=jobs)
 
     with open(filename, "r") as fasta_fh:
-        with_graph(_mk_fasta_cmd(fasta_fh), outfile=outfile)
+        with_graph(_mk_fasta_cmd(fasta_fh), outfile=outfile, pretty=pretty)
 
     return None
 
@@ -938,6 +1458,7 @@ def prep_fasta(
 @include_opt
 @exclude_opt
 @na_opt
+@pretty_opt
 def prep_unpublished_cmd(
     filename: TextIO,
     tag: Optional[str],
@@ -945,6 +1466,7 @@ def prep_unpublished_cmd(
     include: Optional[str],
     exclude: Optional[str],
     na: Optional[str],
+    pretty: bool,
 ) -> NoReturn:
     """
     Prepare an unpublished set up sequences.
@@ -975,7 +1497,7 @@ def prep_unpublished_cmd(
     """
     import octofludb.recipes as recipe
 
-    def _mk_unpublished_fasta_cmd(fh: TextIO) -> Set[Tuple[Node, Node, Node]]:
+    def _mk_unpublished_fasta_cmd(fh: TextIO) -> Iterator[Tuple[Node, Node, Node]]:
 
         (inc, exc, levels) = process_tablelike(include, exclude, None)
 
@@ -987,9 +1509,9 @@ def prep_unpublished_cmd(
             log=True,
             levels=levels,
             na_str=make_na(na),
-        ).connect()
+        ).triples()
 
-    with_graph(_mk_unpublished_fasta_cmd(filename))
+    with_graph(_mk_unpublished_fasta_cmd(filename), pretty=pretty)
 
     sys.exit(0)
 
@@ -1013,6 +1535,7 @@ prep_grp.add_command(prep_unpublished_cmd)
 prep_grp.add_command(prep_tag_cmd)
 prep_grp.add_command(prep_blast_cmd)
 prep_grp.add_command(prep_gbids_cmd)
+prep_grp.add_command(prep_replay_gb_cmd)
 prep_grp.add_command(prep_gis_cmd)
 prep_grp.add_command(prep_ird_cmd)
 prep_grp.add_command(prep_ivr_cmd)
@@ -1032,12 +1555,9 @@ def make_const(url: str, repo: str, outfile: TextIO = sys.stdout) -> None:
     not US). For mixed strains, the constellation will be recorded as "mixed".
     """
     import octofludb.formatting as formatting
-    import pgraphdb as db
 
     sparql_filename = os.path.join(os.path.dirname(__file__), "data", "segments.rq")
-    results = db.sparql_query(
-        sparql_file=sparql_filename, url=url, repo_name=repo
-    ).convert()
+    results = select_json(sparql_filename, url=url, repo=repo)
     formatting.write_constellations(results, outfile=outfile)
     return None
 
@@ -1053,13 +1573,10 @@ def get_missing_subtypes(
     url: str, repo: str
 ) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
     import octofludb.recipes as recipe
-    import pgraphdb as db
 
     sparql_filename = os.path.join(os.path.dirname(__file__), "data", "subtypes.rq")
 
-    results = db.sparql_query(
-        sparql_file=sparql_filename, url=url, repo_name=repo
-    ).convert()
+    results = select_json(sparql_filename, url=url, repo=repo)
 
     return recipe.mk_subtypes(results)
 
@@ -1069,20 +1586,37 @@ def get_missing_subtypes(
 )
 @url_opt
 @repo_name_opt
-def report_masterlist_cmd(url: str, repo: str) -> NoReturn:
+@no_cache_opt
+@click.option(
+    "--server-pivot",
+    is_flag=True,
+    help="Build one row per barcode in the database rather than in Python (transfers much less data)",
+)
+def report_masterlist_cmd(
+    url: str, repo: str, no_cache: bool = False, server_pivot: bool = False
+) -> NoReturn:
     """
     Generate the surveillance masterlist
+
+    With --no-cache, the query results are streamed rather than loaded into
+    memory all at once.
     """
     import octofludb.recipes as recipe
-    import pgraphdb as db
 
-    sparql_filename = os.path.join(os.path.dirname(__file__), "data", "masterlist.rq")
+    if server_pivot:
+        query = "masterlist-pivot.rq"
+    else:
+        query = "masterlist.rq"
+    sparql_filename = os.path.join(os.path.dirname(__file__), "data", query)
 
-    results = db.sparql_query(
-        sparql_file=sparql_filename, url=url, repo_name=repo
-    ).convert()
+    bindings = select_bindings(
+        sparql_filename, url=url, repo=repo, cached=not no_cache
+    )
 
-    recipe.mk_masterlist(results)
+    if server_pivot:
+        recipe.mk_masterlist_pivot(bindings)
+    else:
+        recipe.mk_masterlist(bindings)
 
     sys.exit(0)
 
@@ -1104,28 +1638,21 @@ def fetch_tag_cmd(filename: str, url: str, repo: str) -> NoReturn:
     from octofludb.nomenclature import make_query_tag_uri, P
     from tempfile import mkstemp
 
-    g = open_graph()
     # get all identifiers
     with open(filename, "r") as fh:
         identifiers = [s.strip() for s in fh.readlines()]
 
     # make the turtle file
     taguri = make_query_tag_uri()
-    g = open_graph()
-    for identifier in identifiers:
-        g.add((taguri, P.query_tag, Literal(identifier)))
-    g.commit()  # just in case we missed anything
-    log("Serializing to turtle format ... ", end="")
-    turtles = g.serialize(format="turtle")
-    log("done")
     (n, turtle_filename) = mkstemp(suffix=".ttl")
     with open(turtle_filename, "w") as th:
-        for line in turtles.splitlines():
-            print(line, file=th)
+        with_graph(
+            ((taguri, P.query_tag, Literal(identifier)) for identifier in identifiers),
+            outfile=th,
+        )
 
     # upload it to the database
     upload_cmd([turtle_filename], url, repo)
-    g.close()
 
     sys.exit(0)
 
@@ -1207,12 +1734,10 @@ def fetch_clear_cmd(url: str, repo: str) -> NoReturn:
     """
     Clear all uploaded tags
     """
-    import pgraphdb as db
-
     sparql_filename = os.path.join(
         os.path.dirname(__file__), "data", "clear-query-tags.rq"
     )
-    db.update(sparql_file=sparql_filename, url=url, repo_name=repo)
+    update(sparql_filename, url=url, repo=repo, clear_ledger=True)
 
     sys.exit(0)
 
@@ -1288,7 +1813,8 @@ def macro_query(
 @click.option("--context", is_flag=True, help="Get contextualizing sequences")
 @url_opt
 @repo_name_opt
-def report_monthly_cmd(year, month, context, url, repo):
+@no_cache_opt
+def report_monthly_cmd(year, month, context, url, repo, no_cache=False):
     """
     Surveillance data for the given month (basis of WGS selections)
     """
@@ -1307,14 +1833,28 @@ def report_monthly_cmd(year, month, context, url, repo):
         ]
 
         macro_query(
-            "monthly-context.rq", macros, header=True, fasta=True, url=url, repo=repo
+            "monthly-context.rq",
+            macros,
+            header=True,
+            fasta=True,
+            url=url,
+            repo=repo,
+            cached=not no_cache,
         )
 
     else:
 
         macros = [("__YEAR__", str(year)), ("__MONTH__", str(month))]
 
-        macro_query("wgs.rq", macros, header=True, fasta=False, url=url, repo=repo)
+        macro_query(
+            "wgs.rq",
+            macros,
+            header=True,
+            fasta=False,
+            url=url,
+            repo=repo,
+            cached=not no_cache,
+        )
 
 
 @click.command(
@@ -1374,10 +1914,9 @@ def delete_constellations_cmd(url: str, repo: str) -> NoReturn:
     Delete all constellation data
     """
     import octofludb.script as script
-    import pgraphdb as db
 
     delete_script = script.get_data_file("delete-constellations.rq")
-    db.update(sparql_file=delete_script, url=url, repo_name=repo)
+    update(delete_script, url=url, repo=repo, clear_ledger=True)
 
     sys.exit(0)
 
@@ -1392,10 +1931,9 @@ def delete_subtypes_cmd(url: str, repo: str) -> NoReturn:
     Delete all subtype data
     """
     import octofludb.script as script
-    import pgraphdb as db
 
     delete_script = script.get_data_file("delete-subtypes.rq")
-    db.update(sparql_file=delete_script, url=url, repo_name=repo)
+    update(delete_script, url=url, repo=repo, clear_ledger=True)
 
     sys.exit(0)
 
@@ -1410,10 +1948,9 @@ def delete_us_clades_cmd(url: str, repo: str) -> NoReturn:
     Delete all clade data
     """
     import octofludb.script as script
-    import pgraphdb as db
 
     delete_script = script.get_data_file("delete-us_clades.rq")
-    db.update(sparql_file=delete_script, url=url, repo_name=repo)
+    update(delete_script, url=url, repo=repo, clear_ledger=True)
 
     sys.exit(0)
 
@@ -1428,10 +1965,9 @@ def delete_gl_clades_cmd(url: str, repo: str) -> NoReturn:
     Delete all global H1 clade data
     """
     import octofludb.script as script
-    import pgraphdb as db
 
     delete_script = script.get_data_file("delete-gl_clades.rq")
-    db.update(sparql_file=delete_script, url=url, repo_name=repo)
+    update(delete_script, url=url, repo=repo, clear_ledger=True)
 
     sys.exit(0)
 
@@ -1446,10 +1982,9 @@ def delete_motifs_cmd(url: str, repo: str) -> NoReturn:
     Delete all antigenic motifs
     """
     import octofludb.script as script
-    import pgraphdb as db
 
     delete_script = script.get_data_file("delete-motifs.rq")
-    db.update(sparql_file=delete_script, url=url, repo_name=repo)
+    update(delete_script, url=url, repo=repo, clear_ledger=True)
 
     sys.exit(0)
 
@@ -1481,6 +2016,14 @@ delete_grp.add_command(delete_motifs_cmd)
 
 @click.group(cls=OrderedGroup, context_settings=CONTEXT_SETTINGS)
 @click.version_option(__version__, "-v", "--version", message=__version__)
+@click.option(
+    "--profile-startup",
+    is_flag=True,
+    is_eager=True,
+    expose_value=False,
+    callback=profile_startup,
+    help="Print the time spent importing modules at startup and by commands",
+)
 def cli_grp():
     """
     API and utilities for the USDA swine IVA surveillance database
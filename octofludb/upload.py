@@ -0,0 +1,144 @@
+from __future__ import annotations
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import os
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from octofludb.util import log, ordered_imap
+
+# turtle files smaller than this are concatenated into batches of up to this size
+BATCH_BYTES = 8 * 1024 * 1024
+
+# files are read from disk and sent in pieces of this size
+CHUNK_BYTES = 1024 * 1024
+
+# every predicate-object pair in a turtle file ends with one of these
+STATEMENT_ENDS = (b" .\n", b";\n", b",\n")
+
+
+def count_statements(data: bytes) -> int:
+    """
+    Approximate the number of triples in a block of turtle text
+    """
+    return sum(data.count(end) for end in STATEMENT_ENDS)
+
+
+class TurtleStream:
+    """
+    A file-like request body that streams one or more turtle files in chunks,
+    counting bytes and (approximately) triples as they are sent.
+    """
+
+    def __init__(self, filenames: List[str], chunk_size: int = CHUNK_BYTES):
+        self.filenames = filenames
+        self.chunk_size = chunk_size
+        # each file is followed by a newline in case it does not end with one
+        self.size = sum(os.path.getsize(f) + 1 for f in filenames)
+        self.nbytes = 0
+        self.ntriples = 0
+        self._chunks = self._read_chunks()
+        self._chunk = b""
+        self._offset = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _read_chunks(self) -> Iterator[bytes]:
+        for filename in self.filenames:
+            with open(filename, "rb") as fh:
+                while True:
+                    chunk = fh.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            yield b"\n"
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            data = self._chunk[self._offset :] + b"".join(self._chunks)
+            self._chunk, self._offset = b"", 0
+        else:
+            if self._offset >= len(self._chunk):
+                self._chunk, self._offset = next(self._chunks, b""), 0
+            data = self._chunk[self._offset : self._offset + size]
+            self._offset += len(data)
+        self.nbytes += len(data)
+        self.ntriples += count_statements(data)
+        return data
+
+
+def batch_files(
+    filenames: List[str], batch_bytes: int = BATCH_BYTES
+) -> List[List[str]]:
+    """
+    Group consecutive small files into batches of up to `batch_bytes`, large
+    files are sent on their own. The order of the files is kept.
+    """
+    batches: List[List[str]] = []
+    batch: List[str] = []
+    batch_size = 0
+    for filename in filenames:
+        size = os.path.getsize(filename)
+        if batch and (size >= batch_bytes or batch_size + size > batch_bytes):
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append(filename)
+        batch_size += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def upload_files(
+    filenames: List[str],
+    url: str,
+    repo: str,
+    workers: int = 4,
+    batch_bytes: int = BATCH_BYTES,
+    on_loaded: Optional[Callable[[str], None]] = None,
+) -> List[str]:
+    """
+    Upload turtle files to a GraphDB repository
+
+    Up to `workers` requests are sent at once over a pooled HTTP session.
+    `on_loaded` is called on each file, in input order, after it has been
+    loaded. Return the uploaded files.
+    """
+    from pgraphdb import handle_response
+
+    rest_url = f"{url}/repositories/{repo}/rdf-graphs/service?default"
+    headers = {"Content-Type": "text/turtle"}
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def send(batch: List[str]) -> Tuple[List[str], TurtleStream, float]:
+        body = TurtleStream(batch)
+        start = time.monotonic()
+        response = session.post(rest_url, headers=headers, data=body)
+        elapsed = max(time.monotonic() - start, 1e-6)
+        handle_response(response, writeResult=False)
+        return (batch, body, elapsed)
+
+    loaded: List[str] = []
+    with session, ThreadPoolExecutor(max_workers=workers) as pool:
+        batches = batch_files(filenames, batch_bytes=batch_bytes)
+        for (batch, body, elapsed) in ordered_imap(pool, send, batches, window=workers):
+            if len(batch) == 1:
+                name = batch[0]
+            else:
+                name = f"{len(batch)} files ({batch[0]} ...)"
+            log(
+                f"loaded {name}: {body.nbytes / 1e6:.1f} MB in {elapsed:.1f}s"
+                f" ({body.nbytes / elapsed / 1e6:.2f} MB/s,"
+                f" ~{body.ntriples / elapsed:.0f} triples/s)"
+            )
+            for filename in batch:
+                if on_loaded is not None:
+                    on_loaded(filename)
+            loaded += batch
+    return loaded
@@ -1,5 +1,8 @@
 from __future__ import annotations
 from typing import (
+    Callable,
+    Iterable,
+    Iterator,
     List,
     NoReturn,
     TypeVar,
@@ -9,13 +12,22 @@ from typing import (
     Optional,
     Any,
     Set,
+    TYPE_CHECKING,
 )
 
-from rdflib.term import Node
+from collections import OrderedDict, deque
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from itertools import islice
 import math
+import random
+import os
 import sys
 import re
 
+if TYPE_CHECKING:
+    from rdflib.term import Node
+
 A = TypeVar("A")
 B = TypeVar("B")
 
@@ -121,3 +133,94 @@ def safeAdd(
 ) -> None:
     if s is not None and p is not None and o is not None:
         g.add((s, p, o))
+
+
+def uniq_window(xs: Iterable[A], size: int = 100000) -> Iterator[A]:
+    """
+    Lazily remove duplicates from a stream
+
+    Only the `size` most recently seen distinct items are remembered, so memory
+    is bounded but duplicates further apart than the window will be repeated.
+    """
+    seen: OrderedDict[A, None] = OrderedDict()
+    for x in xs:
+        if x in seen:
+            seen.move_to_end(x)
+            continue
+        seen[x] = None
+        if len(seen) > size:
+            seen.popitem(last=False)
+        yield x
+
+
+def chunked(xs: Iterable[A], size: int) -> Iterator[List[A]]:
+    """
+    Lazily split a stream into lists of `size` items (the last may be shorter)
+    """
+    it = iter(xs)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Exponential backoff with full jitter: a random delay of up to
+    base * 2^attempt seconds, capped at `cap` seconds.
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def ordered_imap(
+    executor: Executor, f: Callable[[A], B], xs: Iterable[A], window: int = 1
+) -> Iterator[B]:
+    """
+    Lazily map `f` over `xs` in an executor
+
+    At most `window` tasks are in flight at a time and results are yielded in
+    the order of the input.
+    """
+    pending: deque = deque()
+    for x in xs:
+        pending.append(executor.submit(f, x))
+        if len(pending) >= max(window, 1):
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+@contextmanager
+def atomic_open(path: str) -> Iterator[TextIO]:
+    """
+    Open a file for writing that only appears at `path` once it is complete
+    """
+    partial = path + ".part"
+    with open(partial, "w") as fh:
+        yield fh
+    os.replace(partial, path)
+
+
+def read_fasta(lines: Iterable[str], sep: str = "|") -> Iterator[List[str]]:
+    """
+    Read FASTA entries one at a time from an iterable of lines (e.g., an open
+    file). Each entry is yielded as its header split into fields on `sep`
+    with the sequence added as a final field. Sequence lines are joined with
+    their leading whitespace removed. Blank lines are skipped.
+    """
+    header: Optional[str] = None
+    seq: List[str] = []
+    for line in lines:
+        line = line.rstrip("\r\n").lstrip(" \t")
+        if line.startswith(">"):
+            if header is not None:
+                yield header.split(sep) + ["".join(seq)]
+            header = line[1:]
+            seq = []
+        elif header is not None:
+            seq.append(line)
+        elif line.strip():
+            die(f"Expected a FASTA header starting with '>', found: {line[:60]}")
+    if header is not None:
+        yield header.split(sep) + ["".join(seq)]
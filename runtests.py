@@ -12,12 +12,20 @@ from octofludb.nomenclature import (
     make_country_uri,
     make_property,
     make_literal,
+    make_date,
 )
-from octofludb.classes import HomoList, Ragged
+from octofludb.classes import HomoList, Ragged, Table
 from octofludb.graph import showTriple
+from octofludb.turtle import write_turtle
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import time
 import unittest
 import rdflib
 import urllib.parse as url
+import io
 
 
 class TestUtil(unittest.TestCase):
@@ -42,6 +50,14 @@ class TestUtil(unittest.TestCase):
             ],
         )
 
+    def test_uniq_window(self):
+        self.assertEqual(list(util.uniq_window([1, 2, 1, 3, 2, 4])), [1, 2, 3, 4])
+        self.assertEqual(list(util.uniq_window([])), [])
+        # duplicates that fall outside the window are repeated
+        self.assertEqual(
+            list(util.uniq_window([1, 2, 3, 1, 1], size=2)), [1, 2, 3, 1]
+        )
+
 
 class TestMakeUri(unittest.TestCase):
     def test_make_uri(self):
@@ -60,6 +76,15 @@ class TestMakeUri(unittest.TestCase):
 
     def test_make_property(self):
         self.assertEqual(make_property("foo baR Baz"), make_property("Foo_bar Baz"))
+        self.assertIs(make_property("foo baR Baz"), make_property("foo baR Baz"))
+
+    def test_make_uri_cache(self):
+        # repeated calls share one URIRef, URIRefs are passed through
+        strain = "A/swine/Iowa/A01/2020"
+        self.assertIs(make_uri(strain), make_uri(strain))
+        uri = make_uri("foo")
+        self.assertEqual(make_uri(rdflib.URIRef("foo")), rdflib.URIRef("foo"))
+        self.assertNotEqual(uri, rdflib.URIRef("foo"))
 
     def test_make_state_uri(self):
         self.assertEqual(make_usa_state_uri("wyoming"), make_usa_state_uri("WY"))
@@ -140,11 +165,55 @@ class TestCountry(unittest.TestCase):
         self.assertEqual(ftok.Country("unitde states").clean, "USA")
         self.assertEqual(ftok.Country("indoesia").clean, "IDN")
         self.assertEqual(ftok.Country("indonesa").clean, "IDN")
+        self.assertEqual(ftok.Country("phillipines").clean, "PHL")
+        self.assertEqual(ftok.Country("untied staets").clean, "USA")
 
     def test_bad_countries(self):
         self.assertEqual(ftok.Country("bogus").clean, None)
 
 
+class TestSpellcheck(unittest.TestCase):
+    def test_wordfinder(self):
+        from octofludb.spellcheck import make_flat_wordfinder
+
+        find = make_flat_wordfinder(["Mexico", "South Korea", "Peru", "Perm"])
+        self.assertEqual(find("mexico"), "mexico")
+        self.assertEqual(find("South korea "), "south_korea")
+        self.assertEqual(find("mexco"), "mexico")  # deletion
+        self.assertEqual(find("mexicoo"), "mexico")  # insertion
+        self.assertEqual(find("mexifo"), "mexico")  # replacement
+        self.assertEqual(find("mexiCo"), "mexico")
+        self.assertEqual(find("emxico"), "mexico")  # transposition
+        self.assertEqual(find("south_kroea"), "south_korea")
+        self.assertEqual(find("mxeicoo"), None)
+        # ties go to the alphabetically first word
+        self.assertEqual(find("perx"), "perm")
+
+    def test_deep_wordfinder(self):
+        from octofludb.spellcheck import make_flat_wordfinder, osa_distance
+
+        find = make_flat_wordfinder(
+            ["Philippines", "Peru", "Argentina"], depth=2, deep_min_length=8
+        )
+        self.assertEqual(find("phillipines"), "philippines")
+        self.assertEqual(find("argnetinia"), "argentina")
+        self.assertEqual(find("phlippines"), "philippines")
+        # short queries are only matched within one edit
+        self.assertEqual(find("pru"), "peru")
+        self.assertEqual(find("pxrx"), None)
+        self.assertEqual(find("phxlxppxnes"), None)
+
+        letters = set("abcdefghijklmnopqrstuvwxyz")
+        self.assertEqual(osa_distance("peru", "peru", letters, 2), 0)
+        self.assertEqual(osa_distance("peru", "epru", letters, 2), 1)
+        self.assertEqual(osa_distance("peru", "pru", letters, 2), 1)
+        self.assertEqual(osa_distance("peru", "perux", letters, 2), 1)
+        self.assertEqual(osa_distance("peru", "pxrx", letters, 2), 2)
+        self.assertEqual(osa_distance("peru", "xxxx", letters, 2), 3)
+        # only letters from the alphabet may be inserted
+        self.assertEqual(osa_distance("peru", "pe_ru", letters, 2), 3)
+
+
 class TestCountryOrState(unittest.TestCase):
     def test_country(self):
         self.assertEqual(ftok.CountryOrState("USA").clean, "USA")
@@ -197,6 +266,23 @@ class TestDate(unittest.TestCase):
             y.as_literal(), rdflib.Literal("1990", datatype=rdflib.XSD.gYear)
         )
 
+    def test_make_literal_dates(self):
+        def lit(x, t=rdflib.XSD.date):
+            return rdflib.Literal(x, datatype=t)
+
+        self.assertEqual(make_literal("2020-01-05"), lit("2020-01-05"))
+        self.assertEqual(make_literal("2020-01-05T10:00:00Z"), lit("2020-01-05"))
+        self.assertEqual(make_literal("May 31, 2018"), lit("2018-05-31"))
+        self.assertEqual(make_literal("1/5/2020"), lit("2020-01-05"))
+        strain = "A/swine/Iowa/A01/2020"
+        self.assertEqual(make_literal(strain), rdflib.Literal(strain))
+        self.assertEqual(make_literal("2020"), rdflib.Literal("2020"))
+        self.assertEqual(make_date("2020-01-05"), lit("2020-01-05"))
+        self.assertEqual(make_date("2020-01"), lit("2020-01", rdflib.XSD.gYearMonth))
+        self.assertEqual(make_date("1999"), lit("1999", rdflib.XSD.gYear))
+        self.assertEqual(make_date("12-Mar-2020"), lit("2020-03-12"))
+        self.assertEqual(make_date("2020-01-05 junk"), None)
+
     def test_year(self):
         self.assertEqual(ftok.Date("2011").clean, "2011")
         self.assertEqual(ftok.Date("11").clean, "2011")
@@ -636,6 +722,70 @@ class TestHomoList(unittest.TestCase):
         self.assertEqual(self.types(["Georgia"]), ["country"])
         self.assertEqual(self.types(["Georgia", "Texas"]), ["state", "state"])
 
+    def test_slotted_tokens(self):
+        import pickle
+
+        tokens = HomoList(["swine", "swine", "human"], field="host").data
+        self.assertIs(tokens[0], tokens[1])
+        for token in tokens + [recipes.IrregularStrain("x"), tok.Unknown("y")]:
+            self.assertFalse(hasattr(token, "__dict__"))
+        copy = pickle.loads(pickle.dumps(tokens[2]))
+        self.assertEqual((copy.clean, copy.field), ("human", "host"))
+
+    def test_test_one_cache(self):
+        before = tok.test_cache_info()
+        self.assertEqual(tok.test_one(ftok.StateUSA, "Iowa"), "IA")
+        self.assertEqual(tok.test_one(ftok.StateUSA, "Iowa"), "IA")
+        self.assertEqual(tok.test_one(ftok.StateUSA, "Iowa", na_str=["Iowa"]), None)
+        self.assertEqual(tok.test_one(ftok.Country, "Iowa"), None)
+        after = tok.test_cache_info()
+        self.assertGreaterEqual(after.hits - before.hits, 1)
+        self.assertLessEqual(after.misses - before.misses, 3)
+        # unhashable values are tested directly
+        self.assertEqual(tok.test_one(tok.Unknown, ["x"]), ["x"])
+        # long values are not cached
+        before = tok.test_cache_info()
+        self.assertEqual(tok.test_one(tok.Unknown, "ACGT" * 100), "ACGT" * 100)
+        self.assertEqual(tok.test_cache_info(), before)
+
+    def test_classify_column_matches_goodness(self):
+        from octofludb.classes import classifyColumn
+        from octofludb.classifier_flucrew import allClassifiers
+
+        seq = "ATGAAGGCAATACTAGTAGTTCTGCTATATACATTTGCAACC"
+        columns = [
+            ["1", "2", "3", "4", "x"],
+            ["1", "2", "3", "x", "y"],
+            ["2020-01-02", "2021-03-04", "2020-01-02", "NA", None],
+            [seq, seq, seq, seq, "NA"],
+            [seq, seq, seq, "NA", "NA"],
+            [seq, "ATG", seq, seq, seq],
+            ["Iowa", "Texas", "Iowa", "Georgia", "Iowa"],
+            ["NA", "NA", None],
+            [],
+        ]
+        classifiers = list(allClassifiers.values())
+        for column in columns:
+            expected = tok.Unknown
+            for classifier in classifiers:
+                if classifier.goodness(column, na_str=["NA"]) > 0.8:
+                    expected = classifier
+                    break
+            (c, matches) = classifyColumn(
+                column, classifiers, tok.Unknown, na_str=["NA"]
+            )
+            self.assertIs(c, expected)
+            for (x, match) in matches.items():
+                self.assertEqual(match, c.testOne(x, na_str=["NA"]))
+            tokens = HomoList(column, na_str=["NA"]).data
+            self.assertEqual(
+                [(t.typename, t.match, t.clean, t.dirty) for t in tokens],
+                [
+                    (t.typename, t.match, t.clean, t.dirty)
+                    for t in (c(x, na_str=["NA"]) for x in column)
+                ],
+            )
+
 
 class TestPhrase(unittest.TestCase):
     def test_phrase(self):
@@ -661,6 +811,42 @@ class TestPhrase(unittest.TestCase):
         )
 
 
+class TestTable(unittest.TestCase):
+    TABLE = "\n".join(
+        ["strain_name\tcollection_date\tnote"]
+        + [
+            f"A/swine/Iowa/A0{i:07d}/2020\t2020-01-{i + 1:02d}\tx{i % 3}"
+            for i in range(20)
+        ]
+    )
+
+    def test_chunked_table(self):
+        serial = list(Table(self.TABLE, na_str=[]).triples())
+        table = Table(self.TABLE, na_str=[], chunk_size=6)
+        # only the first chunk is read up front
+        self.assertEqual(len(table.data), 6)
+        self.assertEqual(list(table.triples()), serial)
+
+    def test_parallel_triples(self):
+        serial = list(Table(self.TABLE, na_str=[], chunk_size=6).triples())
+        table = Table(self.TABLE, na_str=[], chunk_size=6)
+        self.assertEqual(list(table.triples(jobs=2)), serial)
+        fasta = ">A/swine/Iowa/A01/2020|H1N1\nATGG\n>A/swine/Iowa/A02/2020|H3N2\nATGC"
+        serial = list(Ragged(fasta, na_str=[]).triples())
+        self.assertEqual(list(Ragged(fasta, na_str=[]).triples(jobs=2)), serial)
+
+    def test_chunked_types(self):
+        # later chunks are cast to the types inferred from the first chunk
+        text = self.TABLE + "\nnot a strain\tnot a date\tx"
+        table = Table(text, na_str=[], chunk_size=20)
+        phrases = list(table.phrases())
+        self.assertEqual(
+            [t.typename for t in phrases[-1].tokens],
+            ["strain_name", "date", "unknown"],
+        )
+        self.assertEqual(phrases[-1].tokens[0].clean, None)
+
+
 class TestFasta(unittest.TestCase):
     def test_fasta(self):
         # returns nothing since there is not recognizable identifier in the header
@@ -763,6 +949,186 @@ class TestFasta(unittest.TestCase):
         s2 = sorted([(str(s), str(p), str(o)) for s, p, o in g2])
         self.assertEqual(s1, s2)
 
+    def test_read_fasta(self):
+        text = ">a|b\r\nAT GG\r\n\r\n  CC\n>c\n>d||\n\tTT\n  \n"
+        self.assertEqual(
+            list(util.read_fasta(text.splitlines(keepends=True))),
+            [["a", "b", "AT GGCC"], ["c", ""], ["d", "", "", "TT"]],
+        )
+        self.assertEqual(
+            list(util.read_fasta(["\n", ">x y\n", "A\n"], sep=" ")),
+            [["x", "y", "A"]],
+        )
+        self.assertEqual(list(util.read_fasta([])), [])
+
+    def test_parse_fasta_file(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "x.fna")
+            with open(path, "w") as fh:
+                fh.write(">baz\nATGG\n>foo||z\nATG\nGG\n")
+            with open(path) as fh:
+                rows = Ragged(">baz", na_str=[]).parse(fh)
+        self.assertEqual(rows, [["baz", "ATGG"], ["foo", "", "z", "ATGGG"]])
+
+
+class TestMasterlist(unittest.TestCase):
+    def test_mk_masterlist(self):
+        def binding(**kwargs):
+            return {k: {"type": "literal", "value": v} for (k, v) in kwargs.items()}
+
+        common = dict(barcode="A01", subtypes="H1N1", states="IA", strains="s")
+        bindings = [
+            binding(barcode="A02", genbank_id="X4", segment="PB2", earliest_date="x"),
+            binding(
+                genbank_id="X1",
+                segment="HA",
+                segment_subtypes="H1",
+                earliest_date="2020-02-01",
+                us_clades="1A.3.3.3+1A.3.3.2",
+                gl_clades="1A.3.3.3",
+                **common,
+            ),
+            binding(
+                genbank_id="X2",
+                segment="NA",
+                segment_subtypes="N1",
+                earliest_date="2020-01-01",
+                us_clades="classicalSwine",
+                **common,
+            ),
+            binding(
+                genbank_id="X3",
+                segment="M",
+                earliest_date="2020-02-01",
+                us_clades="pdm",
+                consts="TTTPPT",
+                **common,
+            ),
+        ]
+        out = io.StringIO()
+        recipes.mk_masterlist(bindings, outfile=out)
+        lines = [line.split("\t") for line in out.getvalue().splitlines()]
+        self.assertEqual(lines[0], recipes.MASTERLIST_HEADER)
+        self.assertEqual([row[0] for row in lines[1:]], ["A01", "A02"])
+        a01 = dict(zip(lines[0], lines[1]))
+        self.assertEqual(a01["Date"], "2020-01-01,2020-02-01")
+        self.assertEqual(a01["Collection_Q"], "2020Q1")
+        self.assertEqual(a01["H_Genbank"], "X1")
+        self.assertEqual(a01["US_Clade"], "1A.3.3.2,1A.3.3.3")
+        self.assertEqual(a01["H1"], "1A.3.3.2,1A.3.3.3")
+        self.assertEqual(a01["N1"], "classicalSwine")
+        self.assertEqual(a01["M"], "pdm")
+        self.assertEqual(a01["Constellation"], "TTTPPT")
+        self.assertEqual(a01["State"], "IA")
+        self.assertEqual(lines[2][1:], ["x", "", "", "", "", "", "X4"] + [""] * 25)
+
+        # the same data, pivoted in the database by masterlist-pivot.rq
+        empty = {field: "" for field in recipes.MASTERLIST_HEADER[2:]}
+        pivot = [
+            binding(
+                **dict(
+                    empty,
+                    barcode="A01",
+                    Date="2020-02-01\t2020-01-01",
+                    State="IA",
+                    Subtype="H1N1",
+                    Strain="s",
+                    H_Genbank="X1\t",
+                    N_Genbank="\tX2",
+                    M_Genbank="\tX3",
+                    US_Clade="1A.3.3.3+1A.3.3.2\t",
+                    GL_Clade="1A.3.3.3\t",
+                    H1="1A.3.3.3+1A.3.3.2\t",
+                    N1="\tclassicalSwine",
+                    M="\tpdm",
+                    Constellation="TTTPPT",
+                )
+            ),
+            binding(barcode="A02", Date="x", PB2_Genbank="X4", M=""),
+        ]
+        pivoted = io.StringIO()
+        recipes.mk_masterlist_pivot(pivot, outfile=pivoted)
+        self.assertEqual(pivoted.getvalue(), out.getvalue())
+
+        # the same data, streamed as CSV rows
+        import octofludb.sparql as sparql
+
+        fields = sorted({field for b in bindings for field in b})
+        rows = [[b.get(f, {"value": ""})["value"] for f in fields] for b in bindings]
+        streamed = io.StringIO()
+        recipes.mk_masterlist(sparql.rows_as_bindings(fields, iter(rows)), streamed)
+        self.assertEqual(streamed.getvalue(), out.getvalue())
+
+    def test_masterlist_queries_parse(self):
+        from rdflib.plugins.sparql import prepareQuery
+
+        for filename in ["masterlist.rq", "masterlist-pivot.rq"]:
+            with open(script.get_data_file(filename)) as fh:
+                prepareQuery(fh.read())
+
+    def test_masterlist_modes_agree(self):
+        from rdflib import Graph, Literal, Namespace, URIRef
+
+        f = Namespace("https://flu-crew.org/term/")
+        g = Graph()
+        usa = URIRef("https://flu-crew.org/id/usa")
+        g.add((usa, f.code, Literal("USA")))
+        states = [URIRef(f"https://flu-crew.org/id/{x}") for x in ["ia", "mn"]]
+        for state in states:
+            g.add((state, f.abbr, Literal(state.split("/")[-1].upper())))
+        # every optional value is bound, rdflib cannot skip unbound values in
+        # GROUP_CONCAT(DISTINCT ...)
+        segments = [("HA", "H3"), ("HA", "H1"), ("NA", "N2"), ("M", "M")]
+        for (b, barcode) in enumerate(["A02", "A01", "A03"]):
+            sid = URIRef(f"https://flu-crew.org/id/s{b}")
+            for (p, o) in [
+                (f.strain_name, Literal(f"A/swine/Iowa/{barcode}/2020")),
+                (f.strain_name, Literal(f"A/swine/Iowa/{barcode}/2021")),
+                (f.host, Literal("swine")),
+                (f.country, usa),
+                (f.barcode, Literal(barcode)),
+                (f.date, Literal("2020-05-01")),
+                (f.state, states[b % 2]),
+                (f.state, states[(b + 1) % 2]),
+                (f.constellation, Literal("TTTPPT")),
+                (f.subtype, Literal(["H3N2", "H1N2"][b % 2])),
+            ]:
+                g.add((sid, p, o))
+            for (i, (segment, segment_subtype)) in enumerate(segments[b:]):
+                gid = URIRef(f"https://flu-crew.org/id/g{b}_{i}")
+                g.add((sid, f.has_segment, gid))
+                g.add((gid, f.segment_name, Literal(segment)))
+                g.add((gid, f.segment_subtype, Literal(segment_subtype)))
+                g.add((gid, f.genbank_id, Literal(f"MN{b}{i}")))
+                g.add((gid, f.clade, Literal(f"{segment}.{i}")))
+                g.add((gid, f.clade, Literal(f"{segment}.{b}")))
+                g.add((gid, f.gl_clade, Literal("1A")))
+                for motif in ["h3", "sa", "sb", "ca1", "ca2", "cb"]:
+                    g.add((gid, f[f"{motif}_motif"], Literal(f"{motif}{b}")))
+
+        def run(filename):
+            with open(script.get_data_file(filename)) as fh:
+                # rdflib would try to load the GraphDB pseudo-graph
+                query = fh.read().replace("FROM onto:disable-sameAs\n", "")
+            return [
+                {str(k): {"value": str(v)} for (k, v) in row.asdict().items()}
+                for row in g.query(query)
+            ]
+
+        out = io.StringIO()
+        recipes.mk_masterlist(run("masterlist.rq"), outfile=out)
+        pivoted = io.StringIO()
+        recipes.mk_masterlist_pivot(run("masterlist-pivot.rq"), outfile=pivoted)
+        self.assertEqual(pivoted.getvalue(), out.getvalue())
+        lines = [line.split("\t") for line in out.getvalue().splitlines()]
+        self.assertEqual([row[0] for row in lines[1:]], ["A01", "A02", "A03"])
+        a02 = dict(zip(lines[0], lines[2]))
+        self.assertEqual(a02["State"], "IA,MN")
+        self.assertEqual(a02["H_Genbank"], "MN00,MN01")
+        self.assertEqual(a02["US_Clade"], "HA.0,HA.1")
+        self.assertEqual(a02["H1"], "HA.0,HA.1")
+        self.assertEqual(a02["H3"], "HA.0")
+
 
 class TestSubtypeSelection(unittest.TestCase):
     def test_get_subtype_nothing_comes_from_nothing(self):
@@ -1028,5 +1394,725 @@ class TestScripts(unittest.TestCase):
         self.assertEqual(script.partition([], [0, 3, 3]), [])
 
 
+class TestTripleStream(unittest.TestCase):
+    fasta = (
+        ">A/swine/Iowa/A0123456/2020|H1N1|2020-01-31\nATGCATGCATGCATGCATGCATGC\n"
+        ">A/swine/Ohio/A0123457/2021|H3N2|2021-02-28\nATGCATGCATGCATGCATGCAAAA\n"
+    )
+
+    def test_triples_match_connect(self):
+        fasta = Ragged(self.fasta)
+        triples = list(fasta.triples())
+        self.assertEqual(len(triples), len(set(triples)))
+        self.assertEqual(set(triples), fasta.connect())
+
+    def test_phrase_triples_grouped_by_subject(self):
+        phrase = Ragged(self.fasta).data[0]
+        subjects = [s for (s, _, _) in phrase.triples()]
+        # once a subject is left it never appears again
+        runs = [s for (i, s) in enumerate(subjects) if i == 0 or s != subjects[i - 1]]
+        self.assertEqual(len(runs), len(set(runs)))
+
+
+class TestTurtle(unittest.TestCase):
+    def test_write_turtle(self):
+        triples = Ragged(
+            ">A/swine/Iowa/A0123456/2020|H1N1|2020-01-31\nATGCATGCATGCATGCATGCATGC\n"
+        ).connect()
+        out = io.StringIO()
+        self.assertEqual(write_turtle(triples, outfile=out), len(triples))
+        g = rdflib.Graph().parse(data=out.getvalue(), format="turtle")
+        self.assertEqual(set(g), set(triples))
+
+    def test_write_turtle_groups_subjects(self):
+        s = make_uri("A0123456")
+        triples = [
+            (s, make_property("barcode"), make_literal("A0123456", infer=False)),
+            (s, make_property("note"), make_literal('a "quoted"\nnote', infer=False)),
+        ]
+        out = io.StringIO()
+        write_turtle(triples, outfile=out)
+        self.assertEqual(out.getvalue().count(s.n3()), 1)
+        g = rdflib.Graph().parse(data=out.getvalue(), format="turtle")
+        self.assertEqual(set(g), set(triples))
+
+    def test_with_graph_sorts_sets(self):
+        import octofludb.ui as ui
+
+        (a, b) = (make_uri("A0123456"), make_uri("A0123457"))
+        triples = {
+            (b, make_property("barcode"), make_literal("A0123457", infer=False)),
+            (a, make_property("note"), make_literal("x", infer=False)),
+            (a, make_property("barcode"), make_literal("A0123456", infer=False)),
+        }
+        out = io.StringIO()
+        ui.with_graph(triples, outfile=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        barcode = make_property("barcode")
+        self.assertTrue(lines[0].startswith(f"{a.n3()} {barcode.n3()}"))
+        self.assertTrue(lines[2].startswith(b.n3()))
+
+    def test_write_turtle_empty(self):
+        out = io.StringIO()
+        self.assertEqual(write_turtle([], outfile=out), 0)
+        self.assertEqual(out.getvalue(), "")
+
+
+GENBANK_XML = """<?xml version="1.0" encoding="UTF-8"  ?>
+<!DOCTYPE GBSet PUBLIC "-//NCBI//NCBI GBSeq/EN" "https://www.ncbi.nlm.nih.gov/dtd/NCBI_GBSeq.dtd">
+<GBSet>
+<GBSeq>
+  <GBSeq_locus>MN436834</GBSeq_locus>
+  <GBSeq_length>24</GBSeq_length>
+  <GBSeq_moltype>cRNA</GBSeq_moltype>
+  <GBSeq_primary-accession>MN436834</GBSeq_primary-accession>
+  <GBSeq_accession-version>MN436834.1</GBSeq_accession-version>
+  <GBSeq_organism>Influenza A virus (A/swine/Iowa/A02245227/2019(H1N1))</GBSeq_organism>
+  <GBSeq_feature-table>
+    <GBFeature>
+      <GBFeature_key>source</GBFeature_key>
+      <GBFeature_location>1..24</GBFeature_location>
+      <GBFeature_quals>
+        <GBQualifier>
+          <GBQualifier_name>strain</GBQualifier_name>
+          <GBQualifier_value>A/swine/Iowa/A02245227/2019</GBQualifier_value>
+        </GBQualifier>
+        <GBQualifier>
+          <GBQualifier_name>country</GBQualifier_name>
+          <GBQualifier_value>USA</GBQualifier_value>
+        </GBQualifier>
+        <GBQualifier>
+          <GBQualifier_name>collection_date</GBQualifier_name>
+          <GBQualifier_value>2019-10-01</GBQualifier_value>
+        </GBQualifier>
+      </GBFeature_quals>
+    </GBFeature>
+  </GBSeq_feature-table>
+  <GBSeq_sequence>atgcatgcatgcatgcatgcatgc</GBSeq_sequence>
+</GBSeq>
+</GBSet>
+"""
+
+
+class TestGenbankXml(unittest.TestCase):
+    def test_parse_gb_xml(self):
+        import octofludb.genbank as gb
+
+        (triples, errors) = gb.parse_gb_xml(GENBANK_XML.encode())
+        self.assertEqual(errors, [])
+        triple = (
+            make_uri("MN436834"),
+            make_property("genbank_id"),
+            make_literal("MN436834"),
+        )
+        self.assertTrue(triple in triples)
+
+    def test_parallel_parse_matches_serial(self):
+        import octofludb.entrez as entrez
+        import octofludb.ui as ui
+
+        ids = [f"MN43683{i}" for i in range(5)]
+        with mock.patch.object(
+            entrez, "fetch_gb_xml", return_value=([GENBANK_XML.encode()], [], [])
+        ):
+            with mock.patch.object(entrez, "tqdm", side_effect=lambda x, **kw: x):
+                serial = list(ui._mk_gbids_cmd(ids, jobs=1))
+                parallel = list(ui._mk_gbids_cmd(ids, jobs=2))
+        self.assertEqual(set(serial), set(parallel))
+        self.assertEqual(len(serial), len(set(serial)))
+
+    def test_genbank_cache(self):
+        import octofludb.genbank as gb
+        from octofludb.cache import GenbankCache
+
+        xml = GENBANK_XML.encode()
+        with tempfile.TemporaryDirectory() as d:
+            cache = GenbankCache(os.path.join(d, "genbank.sqlite"))
+            self.assertEqual(cache.get(["MN436834.1"]), ([], ["MN436834.1"]))
+            self.assertEqual(cache.put(xml), 1)
+            (records, missing) = cache.get(["MN436834.1", "MN436834", "MN000000"])
+            self.assertEqual(len(records), 1)
+            # unversioned accessions are always refetched
+            self.assertEqual(missing, ["MN436834", "MN000000"])
+            # cached records can be replayed offline into the same triples
+            replayed = [gb.parse_gb_xml(batch)[0] for batch in cache.batches()]
+            self.assertEqual(replayed, [gb.parse_gb_xml(xml)[0]])
+
+    def test_cached_records_are_not_fetched(self):
+        import octofludb.entrez as entrez
+        from octofludb.cache import GenbankCache
+
+        with tempfile.TemporaryDirectory() as d:
+            cache = GenbankCache(os.path.join(d, "genbank.sqlite"))
+            cache.put(GENBANK_XML.encode())
+            with mock.patch.object(entrez, "fetch_gb_xml") as fetch:
+                batches = list(entrez.get_gb_xml(["MN436834.1"], cache=cache))
+            fetch.assert_not_called()
+            self.assertEqual(len(batches), 1)
+
+
+class TestGenbankFetch(unittest.TestCase):
+    def setUp(self):
+        import octofludb.entrez as entrez
+
+        patcher = mock.patch.object(entrez.ncbi_limiter, "wait")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def fake_efetch(bad, calls):
+        from urllib.error import HTTPError
+
+        def efetch(db, id, retmode):
+            calls.append(list(id))
+            if bad & set(id):
+                raise HTTPError("efetch", 400, "Bad Request", {}, None)  # type: ignore
+            return io.BytesIO(GENBANK_XML.encode())
+
+        return efetch
+
+    def test_bisect_bad_ids(self):
+        import octofludb.entrez as entrez
+
+        calls: list = []
+        ids = [f"MN00000{i}" for i in range(8)]
+        with mock.patch.object(
+            entrez.Entrez, "efetch", side_effect=self.fake_efetch({"MN000005"}, calls)
+        ):
+            (xmls, rejected, unfetched) = entrez.fetch_gb_xml(ids)
+        self.assertEqual((rejected, unfetched), (["MN000005"], []))
+        # the good ids were all fetched, in batches that skip the bad one
+        good_calls = [c for c in calls if "MN000005" not in c]
+        self.assertEqual(good_calls, [ids[0:4], ids[4:5], ids[6:8]])
+        self.assertEqual(len(xmls), 3)
+
+    def test_retry_transient_errors(self):
+        from urllib.error import HTTPError
+        import octofludb.entrez as entrez
+
+        responses = [
+            HTTPError("efetch", 502, "Bad Gateway", {}, None),  # type: ignore
+            io.BytesIO(GENBANK_XML.encode()),
+        ]
+        with mock.patch.object(entrez.Entrez, "efetch", side_effect=responses):
+            with mock.patch.object(entrez, "backoff_delay", return_value=0) as delay:
+                (xmls, rejected, unfetched) = entrez.fetch_gb_xml(["MN436834"])
+        self.assertEqual((len(xmls), rejected, unfetched), (1, [], []))
+        delay.assert_called_once()
+
+    def test_transient_failures_are_not_bisected(self):
+        from urllib.error import HTTPError
+        import octofludb.entrez as entrez
+
+        ids = [f"MN00000{i}" for i in range(4)]
+        error = HTTPError("efetch", 503, "Service Unavailable", {}, None)  # type: ignore
+        with mock.patch.object(entrez.Entrez, "efetch", side_effect=error) as efetch:
+            with mock.patch.object(entrez, "backoff_delay", return_value=0):
+                (xmls, rejected, unfetched) = entrez.fetch_gb_xml(ids, max_attempts=3)
+        self.assertEqual((xmls, rejected, unfetched), ([], [], ids))
+        self.assertEqual(efetch.call_count, 3)
+
+    def test_error_document_is_bisected(self):
+        import octofludb.entrez as entrez
+
+        def efetch(db, id, retmode):
+            if "MN000001" in id:
+                return io.BytesIO(b"<ERROR>Invalid uid MN000001</ERROR>")
+            return io.BytesIO(GENBANK_XML.encode())
+
+        with mock.patch.object(entrez.Entrez, "efetch", side_effect=efetch):
+            (xmls, rejected, unfetched) = entrez.fetch_gb_xml(["MN000000", "MN000001"])
+        self.assertEqual((len(xmls), rejected, unfetched), (1, ["MN000001"], []))
+
+    def test_retry_incomplete_xml(self):
+        import octofludb.entrez as entrez
+        import octofludb.genbank as gb
+
+        xml = GENBANK_XML.encode()
+        responses = [io.BytesIO(xml[: len(xml) // 2]), io.BytesIO(xml)]
+        with mock.patch.object(entrez.Entrez, "efetch", side_effect=responses):
+            with mock.patch.object(entrez, "backoff_delay", return_value=0):
+                (xmls, rejected, unfetched) = entrez.fetch_gb_xml(["MN436834"])
+        self.assertEqual((xmls, rejected, unfetched), ([xml], [], []))
+        # a batch that cannot be read is reported rather than raised
+        (triples, errors) = gb.parse_gb_xml(xml[: len(xml) // 2])
+        self.assertEqual(triples, set())
+        self.assertEqual(errors, ["MN436834\tUnreadable GenBank batch"])
+
+    def test_failed_ids_are_logged(self):
+        import octofludb.entrez as entrez
+
+        with mock.patch.object(
+            entrez.Entrez, "efetch", side_effect=self.fake_efetch({"MN000001"}, [])
+        ):
+            with mock.patch.object(entrez.script, "error_log_entry") as log_entry:
+                with mock.patch.object(entrez, "tqdm", side_effect=lambda x, **kw: x):
+                    list(entrez.get_gb_xml(["MN000000", "MN000001"]))
+        log_entry.assert_called_once_with(["MN000001"], "failed_genbank_fetches.txt")
+
+    def test_backoff_delay(self):
+        import octofludb.entrez as entrez
+
+        for attempt in range(10):
+            delay = entrez.backoff_delay(attempt, base=1, cap=60)
+            self.assertTrue(0 <= delay <= min(60, 2**attempt))
+
+
+class TestAccessionIndex(unittest.TestCase):
+    def test_accession_index(self):
+        from octofludb.cache import AccessionIndex
+
+        url, repo = "http://localhost:7200", "octofludb"
+        with tempfile.TemporaryDirectory() as d:
+            index = AccessionIndex(os.path.join(d, "accessions.sqlite"))
+            self.assertFalse(index.is_built(url, repo))
+            index.rebuild(url, repo, ["MN000001", "MN000002"])
+            self.assertTrue(index.is_built(url, repo))
+            self.assertFalse(index.is_built(url, "other"))
+            # versions are ignored and input order is kept
+            self.assertEqual(
+                index.missing(url, repo, ["MN000004.1", "MN000002.3", "MN000003"]),
+                ["MN000004.1", "MN000003"],
+            )
+            index.add(url, repo, ["MN000003.1"])
+            self.assertEqual(index.missing(url, repo, ["MN000003"]), [])
+            # each database has its own accessions
+            self.assertEqual(index.missing(url, "other", ["MN000003"]), ["MN000003"])
+            index.rebuild(url, repo, ["MN000004"])
+            self.assertEqual(
+                index.missing(url, repo, ["MN000001", "MN000004"]), ["MN000001"]
+            )
+
+    def test_missing_acc_uses_index(self):
+        import octofludb.entrez as entrez
+        from octofludb.cache import AccessionIndex
+
+        with tempfile.TemporaryDirectory() as d:
+            index = AccessionIndex(os.path.join(d, "accessions.sqlite"))
+            with mock.patch.object(
+                entrez, "get_all_acc_in_db", return_value=["MN000001"]
+            ) as get_all, mock.patch.object(
+                entrez, "get_acc_by_date", return_value=["MN000001.1", "MN000002.1"]
+            ):
+                for _ in range(2):
+                    missing = list(
+                        entrez.missing_acc_by_date(nmonths=2, index=index)
+                    )
+                    self.assertEqual(len(missing), 2)
+                    self.assertEqual(missing[0][1], ["MN000002.1"])
+            # the database is only queried to build the index
+            get_all.assert_called_once()
+
+
+class TestEsearch(unittest.TestCase):
+    def setUp(self):
+        import octofludb.entrez as entrez
+
+        patcher = mock.patch.object(entrez.ncbi_limiter, "wait")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def fake_esearch(published):
+        """
+        Build a fake requests.get over a list of (date, accession) pairs
+        """
+        from octofludb.entrez import _date_range
+
+        def get(base, params):
+            (first, last) = _date_range(params["mindate"], params["maxdate"])
+            ids = [acc for (date, acc) in published if first <= date <= last]
+            start = int(params["retstart"])
+            retmax = int(params["retmax"])
+            response = mock.Mock()
+            response.json.return_value = {
+                "esearchresult": {
+                    "count": str(len(ids)),
+                    "retmax": str(min(retmax, len(ids) - start)),
+                    "idlist": ids[start : start + retmax],
+                }
+            }
+            return response
+
+        return get
+
+    def test_date_range(self):
+        import datetime
+        from octofludb.entrez import _date_range
+
+        self.assertEqual(
+            _date_range("2020", "2020"),
+            (datetime.date(2020, 1, 1), datetime.date(2020, 12, 31)),
+        )
+        self.assertEqual(
+            _date_range("2020/2", "2020/2"),
+            (datetime.date(2020, 2, 1), datetime.date(2020, 2, 29)),
+        )
+        self.assertEqual(
+            _date_range("2020/02/03", "2020/02/05"),
+            (datetime.date(2020, 2, 3), datetime.date(2020, 2, 5)),
+        )
+
+    def test_truncated_windows_are_split(self):
+        import datetime
+        import octofludb.entrez as entrez
+
+        # 31 ids spread over January and 7 more on a single day
+        published = [
+            (datetime.date(2020, 1, day), f"MN{day:06d}") for day in range(1, 32)
+        ] + [(datetime.date(2020, 1, 15), f"MT{i:06d}") for i in range(7)]
+        with mock.patch.object(
+            entrez.requests, "get", side_effect=self.fake_esearch(published)
+        ):
+            acc = entrez.get_acc_by_date("2020/1", "2020/1", retmax=4)
+        self.assertEqual(sorted(acc), sorted(x for (_, x) in published))
+
+    def test_missing_acc_date_order(self):
+        import datetime
+        import octofludb.entrez as entrez
+
+        published = [
+            (datetime.date(2020, month, 1), f"MN{month:06d}") for month in range(1, 13)
+        ]
+        with mock.patch.object(
+            entrez.requests, "get", side_effect=self.fake_esearch(published)
+        ), mock.patch.object(entrez, "get_all_acc_in_db", return_value=["MN000003"]):
+            missing = list(
+                entrez.missing_acc_by_date(
+                    min_year=2020, max_year=2020, nmonths=12, workers=4
+                )
+            )
+        self.assertEqual(
+            [date for (date, _) in missing], [f"2020/{m}" for m in range(12, 0, -1)]
+        )
+        self.assertEqual(missing[-3][1], [])
+        self.assertEqual(missing[0][1], ["MN000012"])
+
+
+class TestUpload(unittest.TestCase):
+    def write_turtles(self, d, sizes):
+
+        filenames = []
+        for (i, ntriples) in enumerate(sizes):
+            filename = os.path.join(d, f"{i}.ttl")
+            with open(filename, "w") as fh:
+                for j in range(ntriples):
+                    print(f"<http://x/{i}> <http://p/{j}> {j} .", file=fh)
+            filenames.append(filename)
+        return filenames
+
+    def test_turtle_stream(self):
+        from octofludb.upload import TurtleStream
+
+        with tempfile.TemporaryDirectory() as d:
+            filenames = self.write_turtles(d, [3, 0, 5])
+            body = TurtleStream(filenames, chunk_size=7)
+            data = b""
+            while True:
+                chunk = body.read(5)
+                if not chunk:
+                    break
+                data += chunk
+            expected = b"\n".join(open(f, "rb").read() for f in filenames) + b"\n"
+            self.assertEqual(data, expected)
+            self.assertEqual(len(body), len(expected))
+            self.assertEqual(body.nbytes, len(expected))
+            self.assertEqual(TurtleStream(filenames).read(), expected)
+
+    def test_batch_files(self):
+        from octofludb.upload import batch_files
+
+        with tempfile.TemporaryDirectory() as d:
+            filenames = self.write_turtles(d, [1, 1, 20, 1, 1, 1])
+            small = os.path.getsize(filenames[0])
+            batches = batch_files(filenames, batch_bytes=2 * small)
+            self.assertEqual(
+                batches,
+                [filenames[0:2], filenames[2:3], filenames[3:5], filenames[5:6]],
+            )
+
+    def test_upload_files(self):
+        import octofludb.upload as upload
+
+        bodies = []
+
+        def post(url, headers, data):
+            bodies.append(data.read())
+            return mock.Mock(status_code=204, text="")
+
+        with tempfile.TemporaryDirectory() as d:
+            filenames = self.write_turtles(d, [2, 2, 50, 2])
+            loaded = []
+            with mock.patch.object(upload.requests.Session, "post", side_effect=post):
+                result = upload.upload_files(
+                    filenames,
+                    url="http://localhost:7200",
+                    repo="test",
+                    workers=2,
+                    batch_bytes=1000,
+                    on_loaded=loaded.append,
+                )
+            self.assertEqual(result, filenames)
+            self.assertEqual(loaded, filenames)
+            self.assertEqual(len(bodies), 3)
+            self.assertEqual(sum(upload.count_statements(b) for b in bodies), 56)
+
+
+class TestUploadLedger(unittest.TestCase):
+    def test_upload_ledger(self):
+        from octofludb.cache import UploadLedger
+
+        url, repo = "http://localhost:7200", "octofludb"
+        with tempfile.TemporaryDirectory() as d:
+            ledger = UploadLedger(os.path.join(d, "uploads.sqlite"))
+            self.assertFalse(ledger.contains(url, repo, "abc"))
+            ledger.add(url, repo, "abc", "a.ttl")
+            self.assertTrue(ledger.contains(url, repo, "abc"))
+            self.assertFalse(ledger.contains(url, "other", "abc"))
+            ledger.clear(url, repo)
+            self.assertFalse(ledger.contains(url, repo, "abc"))
+
+    def test_upload_skips_identical_files(self):
+        import octofludb.ui as ui
+        from octofludb.cache import UploadLedger
+
+        with tempfile.TemporaryDirectory() as d:
+            ledger = UploadLedger(os.path.join(d, "uploads.sqlite"))
+            a = os.path.join(d, "a.ttl")
+            b = os.path.join(d, "b.ttl")
+            for (filename, text) in [(a, "<x:a> <x:b> 1 ."), (b, "<x:a> <x:b> 2 .")]:
+                with open(filename, "w") as fh:
+                    print(text, file=fh)
+
+            def upload_files(filenames, url, repo, workers, on_loaded):
+                for filename in filenames:
+                    on_loaded(filename)
+                return filenames
+
+            with mock.patch.object(
+                ui, "open_upload_ledger", return_value=ledger
+            ), mock.patch.object(
+                ui, "open_accession_index", return_value=None
+            ), mock.patch.object(
+                ui, "open_query_cache", return_value=None
+            ), mock.patch(
+                "octofludb.upload.upload_files", side_effect=upload_files
+            ):
+                self.assertEqual(ui.upload([a], "url", "repo"), [a])
+                self.assertEqual(ui.upload([a, b], "url", "repo"), [b])
+                self.assertEqual(ui.upload([a], "url", "repo", force=True), [a])
+                # changed files are uploaded again
+                with open(a, "a") as fh:
+                    print("<x:a> <x:b> 3 .", file=fh)
+                self.assertEqual(ui.upload([a, b], "url", "repo"), [a])
+                self.assertEqual(ui.upload([a], "url", "other"), [a])
+                # updates that only delete derived triples (as in `pull`) keep
+                # the ledger, user updates may delete anything so clear it
+                with mock.patch("pgraphdb.update"):
+                    ui.update("delete-constellations.rq", "url", "repo")
+                    self.assertEqual(ui.upload([a, b], "url", "repo"), [])
+                    ui.update("delete.rq", "url", "repo", clear_ledger=True)
+                self.assertEqual(ui.upload([a, b], "url", "repo"), [a, b])
+
+
+class TestQueryCache(unittest.TestCase):
+    def test_query_cache(self):
+        from octofludb.cache import QueryCache
+
+        url, repo = "http://localhost:7200", "octofludb"
+        results = {"head": {"vars": ["x"]}, "results": {"bindings": []}}
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "queries.sqlite")
+            cache = QueryCache(path, ttl=3600, max_bytes=10**6)
+            self.assertIsNone(cache.get("SELECT 1", url, repo))
+            cache.put("SELECT 1", url, repo, results)
+            self.assertEqual(cache.get("SELECT 1", url, repo), results)
+            self.assertIsNone(cache.get("SELECT 2", url, repo))
+            self.assertIsNone(cache.get("SELECT 1", url, "other"))
+            # changing the database makes earlier results stale
+            cache.bump(url, repo)
+            self.assertEqual(cache.stamp(url, repo), 1)
+            self.assertIsNone(cache.get("SELECT 1", url, repo))
+            # expired results are dropped
+            cache.put("SELECT 1", url, repo, results)
+            expired = QueryCache(path, ttl=-1, max_bytes=10**6)
+            self.assertIsNone(expired.get("SELECT 1", url, repo))
+
+    def test_query_cache_eviction(self):
+        from octofludb.cache import QueryCache
+
+        url, repo = "http://localhost:7200", "octofludb"
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "queries.sqlite")
+            cache = QueryCache(path, ttl=3600, max_bytes=10**6)
+            cache.put("SELECT 1", url, repo, {"x": "1"})
+            size = cache.db.execute("SELECT size FROM result").fetchone()[0]
+            cache.max_bytes = 2 * size
+            cache.put("SELECT 2", url, repo, {"x": "2"})
+            cache.get("SELECT 1", url, repo)
+            cache.put("SELECT 3", url, repo, {"x": "3"})
+            # the least recently used result is dropped
+            self.assertIsNone(cache.get("SELECT 2", url, repo))
+            self.assertEqual(cache.get("SELECT 1", url, repo), {"x": "1"})
+            self.assertEqual(cache.get("SELECT 3", url, repo), {"x": "3"})
+
+
+class TestSparql(unittest.TestCase):
+    RESULTS = {
+        "head": {"vars": ["strain", "note", "seq"]},
+        "results": {
+            "bindings": [
+                {
+                    "strain": {"type": "literal", "value": "A/swine/Iowa/A01/2020"},
+                    "note": {"type": "literal", "value": 'a, "quoted"\nnote'},
+                    "seq": {"type": "literal", "value": "ATGG"},
+                },
+                {
+                    "strain": {"type": "literal", "value": "A/swine/Iowa/A02/2020"},
+                    "seq": {"type": "literal", "value": "ATGC"},
+                },
+            ]
+        },
+    }
+    CSV = (
+        b"strain,note,seq\r\n"
+        b'A/swine/Iowa/A01/2020,"a, ""quoted""\nnote",ATGG\r\n'
+        b"A/swine/Iowa/A02/2020,,ATGC\r\n"
+    )
+
+    def select(self):
+        import io
+        import octofludb.sparql as sparql
+
+        response = mock.Mock(status_code=200, raw=io.BytesIO(self.CSV))
+        with mock.patch.object(sparql.requests, "post", return_value=response) as post:
+            result = sparql.select_rows("SELECT", url="http://localhost:7200", repo="x")
+        self.assertEqual(post.call_args.kwargs["headers"], {"Accept": "text/csv"})
+        return result
+
+    def test_stream_table(self):
+        import io
+
+        (fields, rows) = self.select()
+        streamed = io.StringIO()
+        formatter.write_rows_as_table(fields, rows, outfile=streamed)
+        loaded = io.StringIO()
+        formatter.write_as_table(self.RESULTS, outfile=loaded)
+        self.assertEqual(streamed.getvalue(), loaded.getvalue())
+
+    def test_stream_fasta(self):
+        import io
+
+        (fields, rows) = self.select()
+        streamed = io.StringIO()
+        formatter.write_rows_as_fasta(fields, rows, outfile=streamed)
+        loaded = io.StringIO()
+        formatter.write_as_fasta(self.RESULTS, outfile=loaded)
+        self.assertEqual(streamed.getvalue(), loaded.getvalue())
+
+    def test_page_query(self):
+        import octofludb.sparql as sparql
+
+        query = """
+        SELECT DISTINCT
+          # the strain <#name>
+          ?strain (GROUP_CONCAT(?seq; separator="+") as ?seqs)
+        FROM onto:disable-sameAs
+        WHERE { ?sid f:strain_name ?strain . ?sid f:seq ?seq . }
+        GROUP BY ?strain
+        """
+        self.assertEqual(sparql.projected_vars(query), ["strain", "seqs"])
+        self.assertTrue(
+            sparql.page_query(query, 10, 2).endswith(
+                "GROUP BY ?strain\nORDER BY ?strain ?seqs\nLIMIT 10 OFFSET 20\n"
+            )
+        )
+        # the projected variables break ties in the query's own order
+        ordered = "SELECT ?s ?o WHERE { ?s ?p ?o } ORDER BY DESC(?o) # by value"
+        self.assertEqual(
+            sparql.page_query(ordered, 5, 0),
+            ordered + "\n  ?s ?o\nLIMIT 5 OFFSET 0\n",
+        )
+        with self.assertRaises(SystemExit):
+            sparql.page_query("SELECT * WHERE { ?s ?p ?o } ORDER BY ?s", 5, 0)
+        with self.assertRaises(SystemExit):
+            sparql.page_query("SELECT ?s WHERE { ?s ?p ?o } LIMIT 3", 5, 0)
+
+    def test_select_pages(self):
+        import re
+        import octofludb.sparql as sparql
+
+        rows = [[f"s{i:02d}", str(i)] for i in range(23)]
+
+        def post(url, data, headers):
+            paging = re.search(r"LIMIT (\d+) OFFSET (\d+)", data["query"])
+            (limit, offset) = map(int, paging.groups())
+            page = [["s", "n"]] + rows[offset : offset + limit]
+            content = "".join(",".join(row) + "\r\n" for row in page).encode()
+            return mock.Mock(status_code=200, content=content)
+
+        with mock.patch.object(sparql.requests, "post", side_effect=post):
+            (fields, paged) = sparql.select_pages(
+                "SELECT ?s ?n WHERE { ?s ?p ?n }", "url", "x", page_size=5, workers=3
+            )
+            self.assertEqual(fields, ["s", "n"])
+            self.assertEqual(list(paged), rows)
+            (_, resumed) = sparql.select_pages(
+                "SELECT ?s ?n WHERE { ?s ?p ?n }", "url", "x", page_size=5, start_page=2
+            )
+            self.assertEqual(list(resumed), rows[10:])
+
+
+class TestStartup(unittest.TestCase):
+    def test_lazy_imports(self):
+        import subprocess
+        import sys
+
+        code = (
+            "import sys, octofludb.ui, octofludb.classes\n"
+            "print(sorted({'rdflib', 'pandas', 'xlrd', 'pgraphdb'} & set(sys.modules)))"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        self.assertEqual(out.stdout.strip(), "['rdflib']")
+        code = "import sys, octofludb.ui\nprint('rdflib' in sys.modules)"
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        self.assertEqual(out.stdout.strip(), "False")
+
+    def test_import_times(self):
+        from octofludb.ui import import_times
+
+        times = import_times(["octofludb.version"])
+        self.assertIn((0, "octofludb.version"), [(d, m) for (d, m, _) in times])
+
+
+class TestConcurrency(unittest.TestCase):
+    def test_ordered_imap(self):
+        def slow_square(x):
+            time.sleep(0.01 * (5 - x))
+            return x * x
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            self.assertEqual(
+                list(util.ordered_imap(pool, slow_square, range(5), window=3)),
+                [0, 1, 4, 9, 16],
+            )
+            self.assertEqual(list(util.ordered_imap(pool, slow_square, [])), [])
+
+    def test_rate_limiter(self):
+        from octofludb.entrez import RateLimiter
+
+        limiter = RateLimiter(rate=100, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.wait()
+        # the first request is free, the other 5 wait 10ms each
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,111 @@
+"""
+Time `octofludb report masterlist` on synthetic masterlist.rq results
+
+Usage: python bench_masterlist.py [NBARCODES [NSEGMENTS]]
+
+The default of 125,000 barcodes with 8 segments each is 1M result rows. The
+rows are fed to mk_masterlist both as loaded SPARQL JSON bindings and as a
+stream of CSV rows (as with `--no-cache`). Each is timed, then run again to
+measure its peak memory (tracing memory slows the run down).
+"""
+
+import io
+import random
+import sys
+import time
+import tracemalloc
+
+import octofludb.recipes as recipes
+import octofludb.sparql as sparql
+
+SEGMENTS = ["HA", "NA", "PB2", "PB1", "PA", "NP", "M", "NS"]
+FIELDS = [
+    "barcode",
+    "genbank_id",
+    "segment",
+    "segment_subtypes",
+    "subtypes",
+    "earliest_date",
+    "states",
+    "strains",
+    "us_clades",
+    "gl_clades",
+    "consts",
+    "h3_motifs",
+    "sa_motifs",
+    "sb_motifs",
+    "ca1_motifs",
+    "ca2_motifs",
+    "cb_motifs",
+]
+
+
+def synthetic_rows(nbarcodes, nsegments, nclades=20, seed=1):
+    """
+    Lazily generate masterlist.rq CSV rows
+    """
+    r = random.Random(seed)
+    for b in range(nbarcodes):
+        barcode = f"A0{b:07d}"
+        date = f"20{r.randint(10, 23)}-{r.randint(1, 12):02d}-{r.randint(1, 28):02d}"
+        for i in range(nsegments):
+            segment = SEGMENTS[i % len(SEGMENTS)]
+            if segment == "HA":
+                segment_subtype = r.choice(["H1", "H3"])
+            elif segment == "NA":
+                segment_subtype = r.choice(["N1", "N2"])
+            else:
+                segment_subtype = ""
+            yield [
+                barcode,
+                f"MN{b:06d}{i}",
+                segment,
+                segment_subtype,
+                r.choice(["H1N1", "H3N2", "H1N2"]),
+                date,
+                "" if r.random() < 0.1 else "IA",
+                f"A/swine/Iowa/{barcode}/2020",
+                "+".join(f"c{r.randrange(nclades)}" for _ in range(3)),
+                "1A.1",
+                "TTTPPT",
+                "",
+                "x",
+                "y",
+                "",
+                "",
+                "",
+            ]
+
+
+def measure(label, make_bindings):
+    out = io.StringIO()
+    start = time.perf_counter()
+    recipes.mk_masterlist(make_bindings(), outfile=out)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    recipes.mk_masterlist(make_bindings(), outfile=io.StringIO())
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label}: {elapsed:.2f}s, peak {peak / 2**20:.0f} MiB")
+    return out.getvalue()
+
+
+def main(nbarcodes=125000, nsegments=8):
+    print(f"{nbarcodes * nsegments} rows, {nbarcodes} barcodes")
+
+    def loaded():
+        return list(sparql.rows_as_bindings(FIELDS, synthetic_rows(*sizes)))
+
+    def streamed():
+        return sparql.rows_as_bindings(FIELDS, synthetic_rows(*sizes))
+
+    sizes = (nbarcodes, nsegments)
+    a = measure("loaded bindings", loaded)
+    b = measure("streamed rows", streamed)
+    assert a == b
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])